@@ -0,0 +1,74 @@
+import argparse
+import math
+import time
+import numpy as np
+from game import match, batch_match
+from players import (
+    NimPlayer,
+    OptimalPlayer,
+    RandomPlayer,
+    RandomlyOptimal,
+    StochasticRulesBased,
+    TakeAllFromTallest,
+    TakeAllButOneFromTallest,
+    MakeTwinTowers,
+    KeepTaller,
+    ChangeTaller,
+    TakeA1Line,
+)
+
+
+def rules_player(seed: int) -> StochasticRulesBased:
+    rules = [
+        TakeAllFromTallest(),
+        TakeAllButOneFromTallest(),
+        MakeTwinTowers(),
+        KeepTaller(),
+        ChangeTaller(),
+        TakeA1Line(),
+    ]
+    weights = np.random.default_rng(seed).normal(size=(len(rules), 16))
+    return StochasticRulesBased(rules, weights)
+
+
+def bench(match_fn, player_1: NimPlayer, player_2: NimPlayer, games: int, nim_size: int):
+    """Returns the win rate of player_1 and the games per second"""
+    start = time.perf_counter()
+    wins = match_fn(player_1, player_2, games, nim_size)
+    return wins / games, games / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=2000, help="games played by match")
+    parser.add_argument(
+        "--batch_games", type=int, default=100_000, help="games played by batch_match"
+    )
+    parser.add_argument("--nim_size", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    np.random.seed(args.seed)
+    pairs = {
+        "Random vs Random": (RandomPlayer(), RandomPlayer()),
+        "Optimal vs Random": (OptimalPlayer(), RandomPlayer()),
+        "RandomlyOptimal(0.3) vs Random": (RandomlyOptimal(0.3), RandomPlayer()),
+        "StochasticRulesBased vs Random": (rules_player(args.seed), RandomPlayer()),
+        "StochasticRulesBased vs RandomlyOptimal(0.3)": (
+            rules_player(args.seed),
+            RandomlyOptimal(0.3),
+        ),
+    }
+    print(f"{'':46s} {'match':>20s} {'batch_match':>20s} {'speedup':>8s}")
+    for name, (player_1, player_2) in pairs.items():
+        rate, speed = bench(match, player_1, player_2, args.games, args.nim_size)
+        batch_rate, batch_speed = bench(
+            batch_match, player_1, player_2, args.batch_games, args.nim_size
+        )
+        # the win rates should agree, up to the sampling error of match
+        error = max(math.sqrt(rate * (1 - rate) / args.games), 1 / args.games)
+        flag = "" if abs(rate - batch_rate) <= 3 * error else "  MISMATCH"
+        print(
+            f"{name:46s} {rate:6.3f} {speed:8.0f} g/s {batch_rate:6.3f} {batch_speed:8.0f} g/s"
+            f" {batch_speed / speed:7.1f}x" + flag
+        )
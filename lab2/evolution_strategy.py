@@ -1,4 +1,7 @@
 import logging
+import math
+import random
+from concurrent.futures import Executor, ProcessPoolExecutor
 import numpy as np
 from players import (
     NimPlayer,
@@ -12,7 +15,7 @@ from players import (
     ChangeTaller,
     TakeA1Line,
 )
-from game import match
+from game import batch_match
 import logging
 from tqdm import tqdm
 from matplotlib import pyplot as plt
@@ -31,6 +34,20 @@ sig = 1
 # Number of generations (iterations)
 iters = 1_500 // lbd
 adversary = RandomPlayer()  # RandomlyOptimal(0.3)
+# Number of processes evaluating the offspring (1: no process pool)
+WORKERS = 1
+# Offspring evaluated by each task of the pool (None: about 4 tasks per worker)
+CHUNK_SIZE = None
+# Seed of the run (None: a different run each time)
+SEED = None
+# Racing: each generation plays λ·RACE_GAMES games, in rounds of successive
+# halving, so the offspring that keep racing play more than RACE_GAMES games
+# (see race_individuals); half of NUM_GAMES selects as well as NUM_GAMES games each
+RACING = False
+RACE_GAMES = NUM_GAMES // 2
+# If not None, the offspring are also evaluated with RACE_CHECK_GAMES games, to
+# measure the selection error (see selection_error) of racing and of NUM_GAMES games
+RACE_CHECK_GAMES = None
 logging.getLogger().setLevel(logging.INFO)
 
 
@@ -49,67 +66,236 @@ def get_stochastic_rb_player(weight_matrix: np.ndarray) -> StochasticRulesBased:
     return stochastic_rule_player
 
 
-def evaluate_individuals(genotypes: np.ndarray, adversary: NimPlayer):
-    fitness = np.ones(genotypes.shape[0])
+def evaluate_individuals(
+    genotypes: np.ndarray,
+    adversary: NimPlayer,
+    seed: np.random.SeedSequence = None,
+    executor: Executor = None,
+    chunk_size: int = None,
+):
+    """Returns the fitness of the genotypes, in order. With a seed, the games of
+    each genotype are played with their own random stream (spawned from seed), so
+    the fitness is the same with or without an executor and whatever the chunk
+    size (the number of genotypes evaluated by each task of the executor)."""
+    seeds = [None] * len(genotypes)
+    if seed is not None:
+        seeds = seed.spawn(len(genotypes))
+    wins = play_games(genotypes, adversary, seeds, NUM_GAMES, executor, chunk_size)
+    return wins / NUM_GAMES
+
+
+def play_games(
+    genotypes: np.ndarray,
+    adversary: NimPlayer,
+    seeds: list,
+    num_games: int,
+    executor: Executor = None,
+    chunk_size: int = None,
+) -> np.ndarray:
+    """The wins of each genotype in num_games games, with the random stream of its
+    seed (if not None). With an executor, each of its tasks plays the games of
+    chunk_size genotypes (None: one)."""
+    if executor is None:
+        return _play_chunk(genotypes, adversary, seeds, num_games)
+    if chunk_size is None:
+        chunk_size = 1
+    starts = range(0, len(genotypes), chunk_size)
+    chunks = executor.map(
+        _play_chunk,
+        [genotypes[i : i + chunk_size] for i in starts],
+        [adversary] * len(starts),
+        [seeds[i : i + chunk_size] for i in starts],
+        [num_games] * len(starts),
+    )
+    return np.concatenate(list(chunks))
+
+
+def _play_chunk(genotypes: np.ndarray, adversary: NimPlayer, seeds: list, num_games):
+    wins = np.zeros(genotypes.shape[0])
     for i in range(genotypes.shape[0]):
+        if seeds[i] is not None:
+            # the players draw from the global generators
+            stream = np.random.default_rng(seeds[i])
+            np.random.seed(stream.integers(2**32))
+            random.seed(int(stream.integers(2**32)))
         genotype = genotypes[i, :].reshape(NUMBER_PLAYERS, 2**STATES_DIM)
         player = get_stochastic_rb_player(genotype)
-        fitness[i] = match(player, adversary, NUM_GAMES) / NUM_GAMES
-    return fitness
-
-
-population = np.random.randn(mu, NUMBER_PLAYERS * 2**STATES_DIM + 1)
-population[:, -1] = np.random.random(mu)
-
-best_fitness = None
-history = list()
-for step in tqdm(range(iters)):
-    # offspring <- select λ random points from the population of μ
-    offspring = population[np.random.randint(0, sig, size=(lbd,))]
-    # mutate all σ (last column) and replace negative values with a small number
-    offspring[:, -1] = np.random.normal(loc=offspring[:, -1], scale=0.2)
-    offspring[offspring[:, -1] < 1e-5, -1] = 1e-5
-    # mutate all v (all columns but the last), using the σ in the last column
-    offspring[:, 0:-1] = np.random.normal(
-        loc=offspring[:, 0:-1], scale=offspring[:, -1].reshape(-1, 1)
+        wins[i] = batch_match(player, adversary, num_games, NIM_DIM)
+    return wins
+
+
+def race_individuals(
+    genotypes: np.ndarray,
+    adversary: NimPlayer,
+    seed: np.random.SeedSequence,
+    executor: Executor = None,
+    chunk_size: int = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Racing (successive halving) to find the μ best genotypes with the games of
+    evaluate_individuals. The genotypes play λ·RACE_GAMES games in total, split
+    evenly among the rounds: in each round the genotypes still racing share the
+    games of the round, then the worse half of them (at least μ are kept) stop
+    racing. The games freed by the eliminated genotypes go to the others, so the
+    last ones are compared on several times RACE_GAMES games.
+    Returns the fitness (the win rate in the games played) and the number of games
+    played by each genotype: a genotype eliminated earlier played fewer games, so
+    sorting by games and then by fitness ranks it below the ones that kept racing."""
+    n = len(genotypes)
+    seeds = seed.spawn(n)
+    wins = np.zeros(n)
+    games = np.zeros(n, dtype=int)
+    idx = np.arange(n)
+    rounds = max(1, math.ceil(math.log2(n / mu)))
+    for _ in range(rounds):
+        num_games = n * RACE_GAMES // rounds // len(idx)
+        # the games of each round continue the stream of the genotype
+        round_seeds = [seeds[i].spawn(1)[0] for i in idx]
+        wins[idx] += play_games(
+            genotypes[idx], adversary, round_seeds, num_games, executor, chunk_size
+        )
+        games[idx] += num_games
+        # the genotypes still racing have played the same games
+        idx = idx[wins[idx].argsort()[-max(mu, math.ceil(len(idx) / 2)) :]]
+    return wins / games, games
+
+
+def selection_error(
+    fitness: np.ndarray, true_fitness: np.ndarray, games: np.ndarray = None
+) -> tuple[float, float]:
+    """The fraction of the μ best by fitness (by games and then by fitness, if
+    given, as the offspring are ranked after racing) that are not among the μ best
+    by true_fitness, and the difference between the mean true fitness of the two"""
+    if games is None:
+        games = np.zeros(len(fitness))
+    selected = np.lexsort((fitness, games))[-mu:]
+    best = true_fitness.argsort()[-mu:]
+    missed = 1 - len(np.intersect1d(selected, best)) / mu
+    return missed, true_fitness[best].mean() - true_fitness[selected].mean()
+
+
+if __name__ == "__main__":
+    # the random streams of the mutations and of the evaluations are independent
+    seeds = np.random.SeedSequence(SEED)
+    rng = np.random.default_rng(seeds)
+    executor = ProcessPoolExecutor(WORKERS) if WORKERS > 1 else None
+    chunk_size = CHUNK_SIZE
+    if chunk_size is None:
+        chunk_size = math.ceil(lbd / (4 * WORKERS))
+
+    population = rng.standard_normal((mu, NUMBER_PLAYERS * 2**STATES_DIM + 1))
+    population[:, -1] = rng.random(mu)
+
+    best_fitness = None
+    history = list()
+    # games played and selection errors (see selection_error) of each generation
+    games_spent = list()
+    errors = list()
+    for step in tqdm(range(iters)):
+        # offspring <- select λ random points from the population of μ
+        offspring = population[rng.integers(0, sig, size=(lbd,))]
+        # mutate all σ (last column) and replace negative values with a small number
+        offspring[:, -1] = rng.normal(loc=offspring[:, -1], scale=0.2)
+        offspring[offspring[:, -1] < 1e-5, -1] = 1e-5
+        # mutate all v (all columns but the last), using the σ in the last column
+        offspring[:, 0:-1] = rng.normal(
+            loc=offspring[:, 0:-1], scale=offspring[:, -1].reshape(-1, 1)
+        )
+        # add an extra column with the evaluation and sort
+        if RACING:
+            fitness, games = race_individuals(
+                offspring[:, 0:-1], adversary, seeds.spawn(1)[0], executor, chunk_size
+            )
+            games_spent.append(games.sum())
+            if RACE_CHECK_GAMES is not None:
+                # the selection errors of racing and of NUM_GAMES games per offspring
+                true_fitness = (
+                    play_games(
+                        offspring[:, 0:-1],
+                        adversary,
+                        seeds.spawn(lbd),
+                        RACE_CHECK_GAMES,
+                        executor,
+                        chunk_size,
+                    )
+                    / RACE_CHECK_GAMES
+                )
+                full_fitness = evaluate_individuals(
+                    offspring[:, 0:-1], adversary, seeds.spawn(1)[0], executor, chunk_size
+                )
+                errors.append(
+                    selection_error(fitness, true_fitness, games)
+                    + selection_error(full_fitness, true_fitness)
+                )
+        else:
+            fitness = evaluate_individuals(
+                offspring[:, 0:-1], adversary, seeds.spawn(1)[0], executor, chunk_size
+            )
+            games = np.full(lbd, NUM_GAMES)
+            games_spent.append(games.sum())
+        # save best (just for the plot), among the offspring that played all the
+        # games: the fitness of a short race is too noisy
+        full = games == games.max()
+        best = np.flatnonzero(full)[fitness[full].argmax()]
+        if best_fitness is None or best_fitness < fitness[best]:
+            best_fitness = fitness[best]
+        history.append((step, fitness[best], games[best]))
+        # the offspring that stopped racing earlier rank below the others
+        offspring = offspring[np.lexsort((fitness, games))]
+        # select the μ with max fitness and discard fitness
+        population = np.copy(offspring[-mu:])
+
+    logging.info(
+        f"Games played: {sum(games_spent)} "
+        f"({sum(games_spent) / (iters * lbd * NUM_GAMES):.1%} of {lbd} x {NUM_GAMES} per generation)"
     )
-    # add an extra column with the evaluation and sort
-    fitness = evaluate_individuals(offspring[:, 0:-1], adversary)
-    offspring = offspring[fitness.argsort()]
-    # save best (just for the plot)
-    if best_fitness is None or best_fitness < np.max(fitness):
-        best_fitness = np.max(fitness)
-    history.append((step, np.max(fitness)))
-    # select the μ with max fitness and discard fitness
-    population = np.copy(offspring[-mu:])
-
-logging.getLogger().setLevel(logging.DEBUG)
-
-fitness = evaluate_individuals(population[:, 0:-1], adversary)
-logging.info(
-    f"Best solution: {fitness.max()} (with σ={population[fitness.argmax(), -1]:0.3g})"
-)
+    if len(errors) > 0:
+        missed, regret, full_missed, full_regret = np.mean(errors, axis=0)
+        logging.info(
+            f"Selection error: {missed:.1%} of the μ best missed, "
+            f"mean fitness {regret:.3f} lower than the μ best "
+            f"({full_missed:.1%} and {full_regret:.3f} with {NUM_GAMES} games each)"
+        )
 
-logging.getLogger().setLevel(logging.INFO)
+    logging.getLogger().setLevel(logging.DEBUG)
 
-history = np.array(history)
-plt.figure(figsize=(14, 4))
-plt.plot(history[:, 0], history[:, 1], marker=".")
-plt.show()
-
-with open("history.txt", "a") as fp:
-    fp.write("#" * 80 + "\n")
-    fp.write(f"Experiment log.\n")
-    fp.write(f"Number players: {NUMBER_PLAYERS}\n")
-    fp.write(f"State dim: {STATES_DIM}\n")
-    fp.write(f"Num games per match: {NUM_GAMES}\n")
-    fp.write(f"Nim dim: {NIM_DIM}\n")
-    fp.write(f"mu: {mu}, lbd: {lbd}, sig: {sig}\n")
-    fp.write(f"Adversary: {adversary}\n")
-    fp.write(f"Iterations: {iters}\n")
-    fp.write(f"History:\n{history}\n")
-    fp.write(
-        f"Best individual:\n{population[fitness.argmax(), :-1].reshape(NUMBER_PLAYERS, 2**STATES_DIM)}\n"
+    fitness = evaluate_individuals(population[:, 0:-1], adversary, seeds.spawn(1)[0])
+    logging.info(
+        f"Best solution: {fitness.max()} (with σ={population[fitness.argmax(), -1]:0.3g})"
     )
-    fp.write(f"Best sig: {population[fitness.argmax(), -1]}\n")
-    fp.write(f"With fitness: {fitness.max()}\n")
+
+    logging.getLogger().setLevel(logging.INFO)
+    if executor is not None:
+        executor.shutdown()
+
+    history = np.array(history)
+    plt.figure(figsize=(14, 4))
+    plt.plot(history[:, 0], history[:, 1], marker=".")
+    plt.show()
+
+    with open("history.txt", "a") as fp:
+        fp.write("#" * 80 + "\n")
+        fp.write(f"Experiment log.\n")
+        fp.write(f"Number players: {NUMBER_PLAYERS}\n")
+        fp.write(f"State dim: {STATES_DIM}\n")
+        fp.write(f"Num games per match: {NUM_GAMES}\n")
+        fp.write(f"Nim dim: {NIM_DIM}\n")
+        fp.write(f"mu: {mu}, lbd: {lbd}, sig: {sig}\n")
+        fp.write(f"Adversary: {adversary}\n")
+        fp.write(f"Iterations: {iters}\n")
+        fp.write(f"Workers: {WORKERS}, seed: {seeds.entropy}\n")
+        if RACING:
+            fp.write(
+                f"Racing: {RACE_GAMES} games per offspring, successive halving\n"
+            )
+        fp.write(f"Games played: {sum(games_spent)}\n")
+        if len(errors) > 0:
+            fp.write(
+                f"Selection error (missed, regret, with {NUM_GAMES} games): "
+                f"{np.mean(errors, axis=0)}\n"
+            )
+        fp.write(f"History:\n{history}\n")
+        fp.write(
+            f"Best individual:\n{population[fitness.argmax(), :-1].reshape(NUMBER_PLAYERS, 2**STATES_DIM)}\n"
+        )
+        fp.write(f"Best sig: {population[fitness.argmax(), -1]}\n")
+        fp.write(f"With fitness: {fitness.max()}\n")
@@ -8,23 +8,59 @@ def match(player_1: NimPlayer, player_2: NimPlayer, num_games: int, nim_size=5)
     """Returns the wins of player_1 out of num_games games"""
     strategy = [player_1, player_2]
     optimal_wins = 0
+    # the messages are only formatted if they are logged
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
     for round in range(num_games):
-        logging.debug(f"Starting game {round}.")
         nim = Nim(nim_size)
-        logging.debug(f"init : {nim}")
+        if debug:
+            logging.debug(f"Starting game {round}.")
+            logging.debug(f"init : {nim}")
         player = np.random.randint(0, 2)
         while nim:
             ply = strategy[player](nim)
-            logging.debug(f"ply: player {player} plays {ply}")
+            if debug:
+                logging.debug(f"ply: player {player} plays {ply}")
             nim.nimming(ply)
-            logging.debug(f"status: {nim}")
+            if debug:
+                logging.debug(f"status: {nim}")
             player = 1 - player
-        logging.debug(f"status: Player {player} won!")
+        if debug:
+            logging.debug(f"status: Player {player} won!")
         if player == 0:
             optimal_wins += 1
     return optimal_wins
 
 
+def batch_match(
+    player_1: NimPlayer, player_2: NimPlayer, num_games: int, nim_size=5
+) -> int:
+    """Same as match, with the games played together: the rows of the games are
+    the lines of an array, and at each step every game that is not over gets one
+    move, each player choosing the moves of all the games where it is its turn
+    with one call of NimPlayer.batch. Returns the wins of player_1."""
+    strategy = [player_1, player_2]
+    nim = Nim(nim_size)
+    rows = np.tile(np.array(nim.rows, dtype=np.int64), (num_games, 1))
+    player = np.random.randint(0, 2, size=num_games)
+    live = np.arange(num_games)
+    optimal_wins = 0
+    while len(live) > 0:
+        for p in (0, 1):
+            games = live[player[live] == p]
+            if len(games) == 0:
+                continue
+            move_rows, num_objects = strategy[p].batch(rows[games], nim.k)
+            assert np.all(num_objects > 0) and np.all(num_objects <= nim.k)
+            assert np.all(rows[games, move_rows] >= num_objects)
+            rows[games, move_rows] -= num_objects
+        player[live] = 1 - player[live]
+        # the player who takes the last object loses
+        over = ~rows[live].any(axis=1)
+        optimal_wins += np.count_nonzero(player[live[over]] == 0)
+        live = live[~over]
+    return optimal_wins
+
+
 if __name__ == "__main__":
     logging.getLogger().setLevel(logging.DEBUG)
 
@@ -0,0 +1,138 @@
+import argparse
+import os
+import time
+import numpy as np
+from nim import Nim, Nimply
+
+
+def state_radices(num_rows: int) -> list[int]:
+    """The radices of the state codes: row i has 0 to 2i + 1 objects"""
+    return [i * 2 + 2 for i in range(num_rows)]
+
+
+def state_strides(num_rows: int) -> list[int]:
+    """The code of a state is its rows (as a vector) times the strides"""
+    radices = state_radices(num_rows)
+    return [int(np.prod(radices[:i])) for i in range(num_rows)]
+
+
+def all_states(num_rows: int) -> np.ndarray:
+    """The rows of every state, in order of code"""
+    codes = np.arange(int(np.prod(state_radices(num_rows))))
+    return np.stack(
+        [codes // s % r for s, r in zip(state_strides(num_rows), state_radices(num_rows))],
+        axis=1,
+    )
+
+
+class NimTable:
+    """The optimal move of every state of a Nim game with num_rows rows, where at
+    most k objects can be taken at once (None means no limit), and the player who
+    takes the last object loses (as in game.match).
+    A state is encoded as a mixed-radix number, the digit of row i being its number
+    of objects (0 to 2i + 1), so the states are the integers from 0 to size - 1 and a
+    move only lowers the code. The moves are stored in two int8 arrays indexed by
+    the code: the row and the number of objects, both -1 if every move loses."""
+
+    def __init__(self, num_rows: int, k: int = None, rows=None, num_objects=None):
+        self.num_rows = num_rows
+        self.k = _bound(num_rows, k)
+        self.radices = state_radices(num_rows)
+        self.strides = state_strides(num_rows)
+        self.size = int(np.prod(self.radices))
+        if rows is None:
+            rows, num_objects = self.solve()
+        self.rows = rows
+        self.num_objects = num_objects
+
+    def encode(self, rows: tuple) -> int:
+        return sum(r * s for r, s in zip(rows, self.strides))
+
+    def decode(self, code: int) -> tuple:
+        return tuple(code // s % r for s, r in zip(self.strides, self.radices))
+
+    def solve(self) -> tuple[np.ndarray, np.ndarray]:
+        """Retrograde analysis in order of code: a state is won if a move leads to
+        a lost state. The empty state is won (the opponent took the last object).
+        The move of a won state is the first winning one, scanning the rows in order
+        (the winning move of a row is unique, as no move joins two lost states)."""
+        win = np.zeros(self.size, dtype=bool)
+        rows = np.full(self.size, -1, dtype=np.int8)
+        num_objects = np.full(self.size, -1, dtype=np.int8)
+        win[0] = True
+        for code in range(1, self.size):
+            for r, (stride, radix) in enumerate(zip(self.strides, self.radices)):
+                c = code // stride % radix
+                for n in range(1, min(c, self.k) + 1):
+                    if not win[code - n * stride]:
+                        win[code] = True
+                        rows[code], num_objects[code] = r, n
+                        break
+                if win[code]:
+                    break
+        return rows, num_objects
+
+    def move(self, state: Nim):
+        """The optimal move, or None if every move loses"""
+        code = self.encode(state.rows)
+        if self.rows[code] == -1:
+            return None
+        return Nimply(int(self.rows[code]), int(self.num_objects[code]))
+
+    def is_winning(self, state: Nim) -> bool:
+        code = self.encode(state.rows)
+        return code == 0 or self.rows[code] != -1
+
+    def save(self, path: str):
+        np.save(path, np.stack([self.rows, self.num_objects]))
+
+    @staticmethod
+    def load(path: str, num_rows: int, k: int = None) -> "NimTable":
+        moves = np.load(path)
+        return NimTable(num_rows, k, moves[0], moves[1])
+
+
+def _bound(num_rows: int, k: int) -> int:
+    """k, or the largest row if k is None or larger"""
+    largest = num_rows * 2 - 1
+    return largest if k is None else min(k, largest)
+
+
+# tables of the process, by (num_rows, k)
+_tables: dict[tuple[int, int], NimTable] = {}
+
+
+def get_table(num_rows: int, k: int = None, cache_dir: str = None) -> NimTable:
+    """The table of (num_rows, k), solved once per process; with cache_dir, it is
+    also saved to (and then loaded from) a file of that folder"""
+    key = (num_rows, _bound(num_rows, k))
+    if key in _tables:
+        return _tables[key]
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, f"nim_{key[0]}_{key[1]}.npy")
+    if path is not None and os.path.exists(path):
+        table = NimTable.load(path, *key)
+    else:
+        table = NimTable(*key)
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            table.save(path)
+    _tables[key] = table
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_rows", type=int, default=5)
+    parser.add_argument("--k", type=int, default=None)
+    parser.add_argument("--cache_dir", type=str, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table = get_table(args.num_rows, args.k, args.cache_dir)
+    elapsed = time.perf_counter() - start
+    winning = np.count_nonzero(table.rows != -1) + 1
+    print(f"{table.size} states ({winning} winning) in {elapsed:.3f}s")
+    print(f"Starting position {Nim(args.num_rows, args.k)}: ", end="")
+    print("winning" if table.is_winning(Nim(args.num_rows, args.k)) else "losing")
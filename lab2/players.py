@@ -1,7 +1,9 @@
+import bisect
 import logging
 import random
 import numpy as np
 from nim import Nim, Nimply
+from nim_solver import get_table, all_states, state_strides
 from scipy.special import softmax
 
 
@@ -9,35 +11,55 @@ class NimPlayer:
     def __call__(self, state: Nim) -> Nimply:
         pass
 
+    def batch(self, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """The moves in a batch of games, given the rows (one game per line) and
+        k: the row and the number of objects of each move. Asks the player one
+        game at a time, the subclasses with a vectorized version override it."""
+        moves = np.zeros((2, len(rows)), dtype=rows.dtype)
+        state = Nim(rows.shape[1], k)
+        for g, game_rows in enumerate(rows):
+            state._rows = list(game_rows)
+            moves[:, g] = self(state)
+        return moves[0], moves[1]
+
     def __str__(self):
         return str(type(self))
 
 
 class OptimalPlayer(NimPlayer):
-    def nim_sum(self, a):
-        tmp = np.array([tuple(int(x) for x in f"{i:032b}") for i in a])
-        xor = tmp.sum(axis=0) % 2
-        return int("".join(str(_) for _ in xor), base=2)
-
-    def __init__(self):
+    def __init__(self, cache_dir: str = None):
+        """Looks up the optimal move in the NimTable of the game (see nim_solver.py),
+        makes a random move if every move loses."""
         self.random_player = RandomPlayer()
+        self.cache_dir = cache_dir
 
     def __call__(self, state: Nim) -> Nimply:
-        desired_ns = int(np.sum([c - 1 > 0 for c in state.rows]) <= 1)
-        ns = self.nim_sum(state.rows)
-        for r, c in enumerate(state.rows):
-            if not c > 0:
-                continue
-            residual = self.nim_sum((ns, c))
-            if desired_ns == 0:
-                if residual < c:
-                    return Nimply(r, c - residual)
-            else:
-                if residual == 0 and c > 1:
-                    return Nimply(r, c - 1)
-                elif residual == 1:
-                    return Nimply(r, c)
-        return self.random_player(state)
+        table = get_table(len(state.rows), state.k, self.cache_dir)
+        ply = table.move(state)
+        if ply is None:
+            return self.random_player(state)
+        return ply
+
+    def batch(self, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        table = get_table(rows.shape[1], k, self.cache_dir)
+        codes = rows @ table.strides
+        move_rows = table.rows[codes].astype(rows.dtype)
+        num_objects = table.num_objects[codes].astype(rows.dtype)
+        losing = move_rows == -1
+        if losing.any():
+            move_rows[losing], num_objects[losing] = random_moves(rows[losing], k)
+        return move_rows, num_objects
+
+
+def random_moves(rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """RandomPlayer in a batch of games: a random nonempty row, then a random
+    number of objects"""
+    keys = np.random.random(rows.shape)
+    keys[rows == 0] = -1
+    move_rows = keys.argmax(axis=1)
+    top = np.minimum(rows[np.arange(len(rows)), move_rows], k)
+    num_objects = (np.random.random(len(rows)) * top).astype(rows.dtype) + 1
+    return move_rows, num_objects
 
 
 class RandomPlayer(NimPlayer):
@@ -47,6 +69,9 @@ class RandomPlayer(NimPlayer):
         num_objects = random.randint(1, min(state.rows[row], state.k))
         return Nimply(row, num_objects)
 
+    def batch(self, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        return random_moves(rows, k)
+
 
 class RandomlyOptimal(NimPlayer):
     def __init__(self, p: int):
@@ -61,10 +86,65 @@ class RandomlyOptimal(NimPlayer):
         player = self.players[int(np.random.random() > 1 - self.p)]
         return player(state)
 
+    def batch(self, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        move_rows, num_objects = self.expert.batch(rows, k)
+        explore = np.random.random(len(rows)) > 1 - self.p
+        if explore.any():
+            move_rows[explore], num_objects[explore] = random_moves(rows[explore], k)
+        return move_rows, num_objects
+
     def __str__(self):
         return str(type(self)) + f"({self.p})"
 
 
+def project_columns(rows: np.ndarray) -> np.ndarray:
+    """StochasticRulesBased.state_project in a batch of games, as weight columns"""
+    smallest = np.sort(rows, axis=1)
+    m = np.count_nonzero(rows, axis=1)
+    n, n_p = smallest[:, 0], smallest[:, 1]
+    projection = np.stack([m % 2 == 0, n == n_p, n_p > 1, n_p % 2 == 0], axis=1)
+    return projection.astype(int) @ (2 ** np.arange(projection.shape[1]))
+
+
+class RuleTable:
+    """Rules (players with a batch_rule) compiled for every state of the Nim games
+    with num_rows rows and at most k objects per move, indexed by the code of the
+    state (see nim_solver): the weight column of the state and the move of each
+    rule, -1 (None in moves) where the rule calls its backup."""
+
+    def __init__(self, players: list[NimPlayer], num_rows: int, k: int):
+        states = all_states(num_rows)
+        self.strides = np.array(state_strides(num_rows))
+        self.columns = project_columns(states)
+        self.move_rows = np.full((len(players), len(states)), -1, dtype=np.int8)
+        self.num_objects = np.full((len(players), len(states)), -1, dtype=np.int8)
+        codes = np.flatnonzero(states.any(axis=1))
+        for r, player in enumerate(players):
+            move_rows, num_objects, valid = player.batch_rule(states[codes], k)
+            self.move_rows[r, codes[valid]] = move_rows[valid]
+            self.num_objects[r, codes[valid]] = num_objects[valid]
+        # the same, as lists, for the lookups of one state
+        self.column_list = self.columns.tolist()
+        self.moves = [
+            [Nimply(*move) if move[0] != -1 else None for move in zip(rows, objects)]
+            for rows, objects in zip(self.move_rows.tolist(), self.num_objects.tolist())
+        ]
+
+    def encode(self, rows: tuple) -> int:
+        return sum(r * s for r, s in zip(rows, self.strides.tolist()))
+
+
+# rule tables of the process, shared by all the StochasticRulesBased players
+_rule_tables: dict[tuple, RuleTable] = {}
+
+
+def get_rule_table(players: list[NimPlayer], num_rows: int, k: int) -> RuleTable:
+    key = (tuple(type(player) for player in players), num_rows, k)
+    if key not in _rule_tables:
+        _rule_tables[key] = RuleTable(players, num_rows, k)
+    return _rule_tables[key]
+
+
 class StochasticRulesBased(NimPlayer):
     def get_weights(self):
         return self.weights
@@ -79,7 +159,10 @@ class StochasticRulesBased(NimPlayer):
 
     def __init__(self, players: list[NimPlayer], weights: np.ndarray):
         """Pass a list of determinisic players (rules) and a list of
-        weights (probabilities), one for each player."""
+        weights (probabilities), one for each player.
+        If all the players are rules with a batch_rule, the projections and their
+        moves are looked up in a RuleTable, shared by all the players with the same
+        rules, and the player is chosen from the cumulative probabilities."""
         self._state_dims = 4
         self.players = players
         assert weights.shape == (len(players), 2**self._state_dims)
@@ -90,16 +173,60 @@ class StochasticRulesBased(NimPlayer):
             np.arange(self._state_dims, dtype=int),
             dtype=int,
         )
+        self.cumulative = self.probs.cumsum(axis=0)
+        self._cumulative_columns = self.cumulative.T.tolist()
+        self.compiled = all(is_compiled(player) for player in players)
 
     def __call__(self, state: Nim) -> Nimply:
-        state_projection = np.array(self.state_project(state), dtype=int)
-        weights_col = state_projection @ self._decoder
-        logging.debug(f"StochasticRulesBased: Selected col: {weights_col}.")
-        player = self.players[
-            np.random.choice(len(self.players), p=self.probs[:, weights_col])
-        ]
-        logging.debug(f"StochasticRulesBased: chosen player {type(player)}")
-        return player(state)
+        if not self.compiled:
+            state_projection = np.array(self.state_project(state), dtype=int)
+            weights_col = state_projection @ self._decoder
+            logging.debug("StochasticRulesBased: Selected col: %s.", weights_col)
+            player = self.players[
+                np.random.choice(len(self.players), p=self.probs[:, weights_col])
+            ]
+            logging.debug("StochasticRulesBased: chosen player %s", type(player))
+            return player(state)
+        table = get_rule_table(self.players, len(state.rows), state.k)
+        code = table.encode(state.rows)
+        cumulative = self._cumulative_columns[table.column_list[code]]
+        rule = bisect.bisect(cumulative, np.random.random() * cumulative[-1])
+        rule = min(rule, len(self.players) - 1)
+        logging.debug("StochasticRulesBased: chosen player %s", rule)
+        ply = table.moves[rule][code]
+        if ply is None:
+            return self.players[rule].backup(state)
+        return ply
+
+    def batch(self, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        if not self.compiled:
+            return self._batch_players(rows, k)
+        table = get_rule_table(self.players, rows.shape[1], k)
+        codes = rows @ table.strides
+        # one rule per game, by inverse transform sampling of its column
+        cumulative = self.cumulative[:, table.columns[codes]]
+        u = np.random.random(len(rows)) * cumulative[-1]
+        rules = np.minimum((cumulative < u).sum(axis=0), len(self.players) - 1)
+        move_rows = table.move_rows[rules, codes].astype(rows.dtype)
+        num_objects = table.num_objects[rules, codes].astype(rows.dtype)
+        backup = move_rows == -1
+        if backup.any():
+            move_rows[backup], num_objects[backup] = random_moves(rows[backup], k)
+        return move_rows, num_objects
+
+    def _batch_players(self, rows: np.ndarray, k: int):
+        """batch, asking each player for the moves of the games where it is chosen"""
+        columns = project_columns(rows)
+        cumulative = self.cumulative[:, columns]
+        u = np.random.random(len(rows)) * cumulative[-1]
+        rules = np.minimum((cumulative < u).sum(axis=0), len(self.players) - 1)
+        move_rows = np.zeros(len(rows), dtype=rows.dtype)
+        num_objects = np.zeros(len(rows), dtype=rows.dtype)
+        for r, player in enumerate(self.players):
+            games = rules == r
+            if games.any():
+                move_rows[games], num_objects[games] = player.batch(rows[games], k)
+        return move_rows, num_objects
 
 
 class NimPlayerWithBackup(NimPlayer):
@@ -107,13 +234,41 @@ class NimPlayerWithBackup(NimPlayer):
         random = RandomPlayer()
         return random(state)
 
+    # A rule can define batch_rule(rows, k), returning its moves in a batch of
+    # games (row and number of objects) and whether they are valid (where they are
+    # not, the backup is called). It must be deterministic: the rules with a
+    # batch_rule are compiled in RuleTable.
+
+    def batch(self, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        if not is_compiled(self):
+            return super().batch(rows, k)
+        move_rows, num_objects, valid = self.batch_rule(rows, k)
+        move_rows = move_rows.astype(rows.dtype)
+        num_objects = num_objects.astype(rows.dtype)
+        if not valid.all():
+            move_rows[~valid], num_objects[~valid] = random_moves(rows[~valid], k)
+        return move_rows, num_objects
+
+
+def is_compiled(player: NimPlayer) -> bool:
+    """Whether the player is a rule with a batch_rule (see NimPlayerWithBackup)"""
+    return getattr(player, "batch_rule", None) is not None
+
 
 class TakeAllFromTallest(NimPlayer):
     def __call__(self, state: Nim) -> Nimply:
         tallest_row = np.argmax(state.rows)
-        logging.debug(f"Player: TakeAllFromTallest: tallest_row is {tallest_row}.")
+        logging.debug("Player: TakeAllFromTallest: tallest_row is %s.", tallest_row)
         return Nimply(tallest_row, min(state.rows[tallest_row], state.k))
 
+    def batch_rule(self, rows: np.ndarray, k: int):
+        """The moves in a batch of games, and whether they are valid (always)"""
+        tallest_row = rows.argmax(axis=1)
+        return tallest_row, np.minimum(rows.max(axis=1), k), np.ones(len(rows), bool)
+
+    def batch(self, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        return self.batch_rule(rows, k)[:2]
+
 
 class TakeAllButOneFromTallest(NimPlayerWithBackup):
     def __call__(self, state: Nim) -> Nimply:
@@ -121,10 +276,14 @@ class TakeAllButOneFromTallest(NimPlayerWithBackup):
         if not state.rows[tallest_row] > 1:
             return self.backup(state)
         logging.debug(
-            f"Player: TakeAllButOneFromTallest: tallest_row is {tallest_row}."
+            "Player: TakeAllButOneFromTallest: tallest_row is %s.", tallest_row
         )
         return Nimply(tallest_row, min(state.rows[tallest_row] - 1, state.k))
 
+    def batch_rule(self, rows: np.ndarray, k: int):
+        tallest_row, n = rows.argmax(axis=1), rows.max(axis=1)
+        return tallest_row, np.minimum(n - 1, k), n > 1
+
 
 def get_two_tallest_with_indeces(state: Nim) -> tuple[int]:
     rows = list(state.rows)
@@ -140,24 +299,45 @@ def get_two_tallest_with_indeces(state: Nim) -> tuple[int]:
     )
 
 
+def batch_two_tallest(rows: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """get_two_tallest_with_indeces in a batch of games: the tallest row and the
+    sizes of the two tallest rows"""
+    games = np.arange(len(rows))
+    tallest_row = rows.argmax(axis=1)
+    others = rows.copy()
+    others[games, tallest_row] = 0
+    # as in get_two_tallest_with_indeces, the second tallest row is the first of
+    # the others with the most objects, which is the tallest if the others are empty
+    second_tallest_row = others.argmax(axis=1)
+    return tallest_row, rows[games, tallest_row], rows[games, second_tallest_row]
+
+
 class MakeTwinTowers(NimPlayerWithBackup):
     def __call__(self, state: Nim) -> Nimply:
         tallest_row, _, n, n_p = get_two_tallest_with_indeces(state)
         if n_p < n:
             return Nimply(tallest_row, n - n_p)
         else:
-            logging.debug(f"Player: MakeTwinTowers: calling backup")
+            logging.debug("Player: MakeTwinTowers: calling backup")
             return self.backup(state)
 
+    def batch_rule(self, rows: np.ndarray, k: int):
+        tallest_row, n, n_p = batch_two_tallest(rows)
+        return tallest_row, n - n_p, n_p < n
+
 
 class ChangeTaller(NimPlayerWithBackup):
     def __call__(self, state: Nim):
         tallest_row, _, n, n_p = get_two_tallest_with_indeces(state)
         if not n_p >= 1:
-            logging.debug(f"Player: ChangeTaller: calling backup")
+            logging.debug("Player: ChangeTaller: calling backup")
             return self.backup(state)
         return Nimply(tallest_row, n - n_p + 1)
 
+    def batch_rule(self, rows: np.ndarray, k: int):
+        tallest_row, n, n_p = batch_two_tallest(rows)
+        return tallest_row, n - n_p + 1, n_p >= 1
+
 
 class KeepTaller(NimPlayerWithBackup):
     def __call__(self, state: Nim):
@@ -165,9 +345,13 @@ class KeepTaller(NimPlayerWithBackup):
         if n_p + 1 < n:
             return Nimply(tallest_row, n - n_p - 1)
         else:
-            logging.debug(f"Player: KeepTaller: calling backup")
+            logging.debug("Player: KeepTaller: calling backup")
             return self.backup(state)
 
+    def batch_rule(self, rows: np.ndarray, k: int):
+        tallest_row, n, n_p = batch_two_tallest(rows)
+        return tallest_row, n - n_p - 1, n_p + 1 < n
+
 
 class TakeA1Line(NimPlayerWithBackup):
     def __call__(self, state: Nim):
@@ -177,5 +361,9 @@ class TakeA1Line(NimPlayerWithBackup):
         if state.rows[i] == 1:
             return Nimply(i, 1)
         else:
-            logging.debug(f"Player: TakeA1Line: calling backup")
+            logging.debug("Player: TakeA1Line: calling backup")
             return self.backup(state)
+
+    def batch_rule(self, rows: np.ndarray, k: int):
+        ones = rows == 1
+        return ones.argmax(axis=1), np.ones(len(rows), rows.dtype), ones.any(axis=1)
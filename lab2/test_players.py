@@ -0,0 +1,69 @@
+import numpy as np
+from nim import Nim, Nimply
+from nim_solver import all_states
+from game import match, batch_match
+from players import (
+    NimPlayerWithBackup,
+    RandomPlayer,
+    StochasticRulesBased,
+    TakeAllFromTallest,
+    TakeAllButOneFromTallest,
+    MakeTwinTowers,
+    KeepTaller,
+    ChangeTaller,
+    TakeA1Line,
+    get_rule_table,
+    is_compiled,
+)
+
+
+class TakeOneFromFirst(NimPlayerWithBackup):
+    """A rule without batch_rule: it cannot be compiled"""
+
+    def __call__(self, state: Nim) -> Nimply:
+        for r, c in enumerate(state.rows):
+            if c > 0:
+                return Nimply(r, 1)
+        return self.backup(state)
+
+
+def test_uncompiled_rule():
+    np.random.seed(0)
+    rule = TakeOneFromFirst()
+    assert not is_compiled(rule)
+    player = StochasticRulesBased([rule, TakeAllFromTallest()], np.zeros((2, 16)))
+    assert not player.compiled
+    for match_fn in (match, batch_match):
+        assert 0 <= match_fn(player, RandomPlayer(), 50) <= 50
+        assert 0 <= match_fn(rule, RandomPlayer(), 50) <= 50
+
+
+def test_rule_table():
+    rules = [
+        TakeAllFromTallest(),
+        TakeAllButOneFromTallest(),
+        MakeTwinTowers(),
+        KeepTaller(),
+        ChangeTaller(),
+        TakeA1Line(),
+    ]
+    player = StochasticRulesBased(rules, np.zeros((len(rules), 16)))
+    assert player.compiled
+    states = all_states(5)
+    for k in (11, 3):
+        table = get_rule_table(rules, 5, k)
+        for code in range(1, len(states)):
+            state = Nim(5, k)
+            state._rows = list(states[code])
+            projection = np.array(player.state_project(state), dtype=int)
+            assert table.column_list[code] == projection @ player._decoder
+            for r, rule in enumerate(rules):
+                # where the rule calls its backup, the move is random
+                if table.moves[r][code] is not None:
+                    assert rule(state) == table.moves[r][code], (k, code, r)
+
+
+if __name__ == "__main__":
+    test_uncompiled_rule()
+    test_rule_table()
+    print("The rules behave the same compiled and not.")
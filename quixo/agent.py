@@ -2,11 +2,29 @@ import torch
 import torch.nn.functional as F
 import numpy as np
 from game import Player, Move, Game
+import utils
 
 OUTPUT_SPACE = 4 + 16  # 4*16
 INPUT_SPACE = 25  # 5*5
 HIDDEN_NEURONS = 64
 
+# (side, cell) outputs of the Policy that are moves of the rules, whoever owns the cell
+STATIC_MASK = torch.zeros(4, 16, dtype=torch.bool)
+STATIC_MASK[utils.ACTION_SIDES, utils.ACTION_POLICY_CELLS] = True
+# flat index in the board of each of the 16 cells of the Policy
+POLICY_BOARD_CELLS = np.array([y * 5 + x for x, y in map(utils.map_board, range(16))])
+# OWNER_ALLOWED[my_id, owner + 1]: whether my_id can take a cell of owner
+OWNER_ALLOWED = np.array([[True, True, False], [True, False, True]])
+
+
+def legal_mask(boards: np.ndarray, my_ids) -> torch.Tensor:
+    """Legal (side, cell) outputs for a board (25) or a batch of boards (N, 25), and
+    the player (an int or an array (N,)): the static mask of the rules and the cells
+    that are neutral or owned by the player. Returns a (4, 16) or (N, 4, 16) mask."""
+    owners = boards[..., POLICY_BOARD_CELLS] + 1
+    allowed = OWNER_ALLOWED[np.asarray(my_ids)[..., None], owners]
+    return STATIC_MASK & torch.from_numpy(allowed)[..., None, :]
+
 
 class Policy(torch.nn.Module):
     def __init__(self):
@@ -29,21 +47,50 @@ class Policy(torch.nn.Module):
         x = F.relu(self.fc1a(x_r))
         x = F.relu(self.fc1b(x))
         x = self.fc2(x + x_r)
-        side = F.softmax(x[:4], dim=0)
-        cell = F.softmax(x[4:], dim=0)
+        # x is a board (25) or a batch of boards (N, 25)
+        side = F.softmax(x[..., :4], dim=-1)
+        cell = F.softmax(x[..., 4:], dim=-1)
         return side, cell
 
 
+def export_policy(policy: Policy, path: str):
+    """Saves policy as TorchScript, which load_policy (or torch.jit.load) can load
+    without this module, to play with train=False"""
+    torch.jit.script(policy).save(path)
+
+
+def load_policy(path) -> torch.nn.Module:
+    """Loads a TorchScript export or a state dict of a Policy, from a path or a
+    file object"""
+    try:
+        return torch.jit.load(path)
+    except RuntimeError:
+        if hasattr(path, "seek"):
+            path.seek(0)
+        policy = Policy()
+        policy.load_state_dict(torch.load(path))
+        return policy
+
+
 class NeuralPlayer(Player):
-    def __init__(self, policy: Policy, train=True, print_board=False, eps=0.1):
+    def __init__(
+        self, policy: Policy, train=True, print_board=False, eps=0.1, num_threads=None
+    ):
+        """With train=False, the moves are chosen without autograd (torch.inference_mode)
+        and there is no optimizer. num_threads, if given, is passed to torch.set_num_threads
+        (it applies to the whole process)."""
         self.policy = policy
         self.train = train
         self.print_board = print_board
         self.action_probs = []
-        self.optimizer = torch.optim.Adam(
-            policy.parameters(), lr=1e-3, weight_decay=0.001
-        )
+        self.optimizer = None
+        if train:
+            self.optimizer = torch.optim.Adam(
+                policy.parameters(), lr=1e-3, weight_decay=0.001
+            )
         self.eps = eps
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
 
     def map_board(self, x: int):
         if x // 4 == 0:
@@ -73,21 +120,37 @@ class NeuralPlayer(Player):
     ):
         y_side = y_side.reshape(4, 1)
         y_cell = y_cell.reshape(1, 16)
-        board = game.get_board()
+        board = game.get_board().ravel()
         my_id = game.get_current_player()
         actions = y_side @ y_cell
         actions = actions + 1e-8
-        for i in range(16):
-            cell = self.map_board(i)
-            if board[cell[1], cell[0]] not in {-1, my_id}:
-                actions[:, i] = 0
-                continue
-            for side in self.get_cell_sides(cell):
-                actions[side, i] = 0
+        actions = actions * legal_mask(board, my_id)
         actions = actions / actions.sum()
         return actions
 
+    def get_batch_allowed_action_probs(
+        self, y_side: torch.Tensor, y_cell: torch.Tensor, boards: np.ndarray, my_ids
+    ):
+        """get_allowed_action_probs for a batch of boards (N, 25) and the player
+        of each board: returns (N, 4, 16) probabilities"""
+        actions = y_side[:, :, None] @ y_cell[:, None, :]
+        actions = actions + 1e-8
+        my_ids = np.broadcast_to(my_ids, (len(boards),))
+        actions = actions * legal_mask(boards, my_ids)
+        actions = actions / actions.sum(dim=(1, 2), keepdim=True)
+        return actions
+
+    def explore(self, action_probs: torch.Tensor):
+        """Gives probability eps to the illegal actions, like make_move does in
+        training, for a batch of (N, 4, 16) probabilities"""
+        action_probs = torch.where(action_probs == 0, action_probs + self.eps, action_probs)
+        return action_probs / action_probs.sum(dim=(1, 2), keepdim=True)
+
     def make_move(self, game: Game):
+        with torch.inference_mode(not self.train):
+            return self.sample_move(game)
+
+    def sample_move(self, game: Game):
         board = game.get_board()
         x_np = board.reshape((25,))
         x = torch.tensor(x_np, dtype=torch.float32)
@@ -114,6 +177,8 @@ class NeuralPlayer(Player):
         return cell, side
 
     def episode_finished(self, reward):
+        if not self.train:
+            return
         action_probs = torch.stack(self.action_probs, dim=0).squeeze()
         self.action_probs = []
         if self.train:
@@ -121,3 +186,29 @@ class NeuralPlayer(Player):
             loss.backward()
             self.optimizer.step()
             self.optimizer.zero_grad()
+
+    def episodes_finished(self, episodes: list[tuple[np.ndarray, np.ndarray, int]]):
+        """REINFORCE update over a batch of episodes played by player 0, each given
+        as (boards (T, 25), actions (T,) flattened side * 16 + cell, reward).
+        The log probabilities are computed again, in a single forward pass;
+        the loss is the mean over the episodes of the loss of episode_finished."""
+        if not self.train or len(episodes) == 0:
+            return
+        boards = np.concatenate([boards for boards, _, _ in episodes])
+        actions = torch.as_tensor(np.concatenate([actions for _, actions, _ in episodes]))
+        lengths = [len(actions) for _, actions, _ in episodes]
+        rewards = torch.tensor(
+            [float(reward) for _, _, reward in episodes]
+        ).repeat_interleave(torch.tensor(lengths))
+        x = torch.tensor(boards, dtype=torch.float32)
+        y_side, y_cell = self.policy.forward(x)
+        action_probs = self.get_batch_allowed_action_probs(y_side, y_cell, boards, 0)
+        action_probs = self.explore(action_probs).reshape(len(boards), 64)
+        log_probs = torch.log(action_probs[torch.arange(len(boards)), actions])
+        weights = torch.tensor(
+            [1 / (length * len(episodes)) for length in lengths]
+        ).repeat_interleave(torch.tensor(lengths))
+        loss = torch.sum(log_probs * (-rewards) * weights)
+        loss.backward()
+        self.optimizer.step()
+        self.optimizer.zero_grad()
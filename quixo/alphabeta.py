@@ -0,0 +1,258 @@
+import time
+from game import Game, Move, Player
+from bitboard import BitBoard, has_line, longest_line, update_counts
+from zobrist import hash_bits, zobrist_hash, ZOBRIST_TURN
+import utils
+
+# scores are from the point of view of the player to move: a win in n plies
+# is worth WIN - n, anything above WIN_BOUND (or below -WIN_BOUND) is a forced
+# win (or loss), the heuristic evaluation is between -5 and 5
+WIN = 1000
+WIN_BOUND = WIN - 100
+INF = WIN + 1
+
+# kinds of values stored in the transposition table
+EXACT, LOWER, UPPER = 0, 1, 2
+
+_CELLS = [m[0] for m in utils.ACTION_SLIDES]
+_GATHERS = utils.ACTION_GATHERS
+
+
+class _Timeout(Exception):
+    pass
+
+
+def evaluate(own_counts: int, other_counts: int) -> int:
+    """The longest line of the player to move minus the longest line of the
+    opponent, like utils.minimax_heuristic, from the line counts (see bitboard)"""
+    return longest_line(own_counts) - longest_line(other_counts)
+
+
+class AlphaBeta:
+    """Negamax search with alpha-beta pruning and iterative deepening on bitboards.
+    Moves are ordered by the best move in the transposition table, then the two
+    killer moves of the ply and then the history heuristic. The transposition table
+    keys on the Zobrist hash of the board and the turn; each entry stores the
+    exact board, to detect collisions, and whether the value is exact or a bound.
+    A move that completes a line for the opponent loses, even if it also completes
+    a line for the player who moves."""
+
+    def __init__(self, max_entries=1_000_000):
+        self.max_entries = max_entries
+        self.table: dict[int, tuple] = {}
+        self.killers: list[list[int]] = []
+        self.history = [0] * len(utils.ACTIONS)
+        self.deadline = None
+        # nodes searched, since the creation of the object
+        self.nodes = 0
+
+    def search(
+        self, own, other, counts, player, board_hash, depth, alpha, beta, ply
+    ) -> int:
+        """Value of the board for the player to move, whose pieces are own;
+        counts are the line counts of own and other"""
+        self.nodes += 1
+        if self.deadline is not None and self.nodes % 1024 == 0:
+            if time.perf_counter() > self.deadline:
+                raise _Timeout()
+        if depth == 0:
+            return evaluate(*counts)
+
+        alpha_0 = alpha
+        tt_move = -1
+        entry = self.table.get(board_hash)
+        if entry is not None and entry[0] == (own, other):
+            _, entry_depth, value, flag, tt_move = entry
+            # mate scores are stored relative to the node
+            if value > WIN_BOUND:
+                value -= ply
+            elif value < -WIN_BOUND:
+                value += ply
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+
+        while len(self.killers) <= ply:
+            self.killers.append([-1, -1])
+        killers = self.killers[ply]
+        history = self.history
+        moves = [a for a in range(len(_CELLS)) if not other & _CELLS[a]]
+        moves.sort(
+            key=lambda a: (a == tt_move, a == killers[0] or a == killers[1], history[a]),
+            reverse=True,
+        )
+
+        best_value, best_move = -INF, -1
+        for a in moves:
+            _, keep, shifted, up, down, dest = utils.ACTION_SLIDES[a]
+            new_own = (own & keep) | (((own & shifted) << up) >> down) | dest
+            new_other = (other & keep) | (((other & shifted) << up) >> down)
+            own_counts = update_counts(counts[0], own, new_own, _GATHERS[a])
+            other_counts = update_counts(counts[1], other, new_other, _GATHERS[a])
+            if has_line(other_counts):
+                value = -WIN + ply + 1
+            elif has_line(own_counts):
+                value = WIN - ply - 1
+            else:
+                new_hash = (
+                    board_hash
+                    ^ hash_bits(own ^ new_own, player)
+                    ^ hash_bits(other ^ new_other, 1 - player)
+                    ^ ZOBRIST_TURN
+                )
+                value = -self.search(
+                    new_other,
+                    new_own,
+                    (other_counts, own_counts),
+                    1 - player,
+                    new_hash,
+                    depth - 1,
+                    -beta,
+                    -alpha,
+                    ply + 1,
+                )
+            if value > best_value:
+                best_value, best_move = value, a
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                if a != killers[0]:
+                    killers[1], killers[0] = killers[0], a
+                history[a] += depth * depth
+                break
+
+        if best_value <= alpha_0:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        stored = best_value
+        if stored > WIN_BOUND:
+            stored += ply
+        elif stored < -WIN_BOUND:
+            stored -= ply
+        if len(self.table) >= self.max_entries:
+            self.table.clear()
+        self.table[board_hash] = ((own, other), depth, stored, flag, best_move)
+        return best_value
+
+    @staticmethod
+    def root_hash(board: BitBoard, player: int) -> int:
+        return zobrist_hash(board) ^ (ZOBRIST_TURN if player == 1 else 0)
+
+    def best_move(self, board: BitBoard, player: int, max_depth=4, deadline=None):
+        """Iterative deepening until max_depth (None means no limit) or until the
+        time.perf_counter() deadline. Returns the best action, its value and the
+        depth of the last completed iteration; the first iteration is always completed."""
+        own, other = board.bits[player], board.bits[1 - player]
+        counts = board.line_counts()
+        counts = (counts[player], counts[1 - player])
+        board_hash = AlphaBeta.root_hash(board, player)
+        best = None
+        depth = 0
+        while max_depth is None or depth < max_depth:
+            depth += 1
+            self.deadline = deadline if depth > 1 else None
+            try:
+                value = self.search(
+                    own, other, counts, player, board_hash, depth, -INF, INF, 0
+                )
+            except _Timeout:
+                break
+            finally:
+                self.deadline = None
+            best = (utils.ACTIONS[self.table[board_hash][4]], value, depth)
+            if abs(value) > WIN_BOUND:
+                break
+        return best
+
+    def solve_children(self, board: BitBoard, player: int, max_depth=4, deadline=None):
+        """Looks for forced wins and losses after each legal action of player.
+        Returns a dict: action -> 1 if the action wins, -1 if it loses, 0 if
+        the search could not decide, with iterative deepening until max_depth
+        (None means no limit) or until the deadline."""
+        own, other = board.bits[player], board.bits[1 - player]
+        counts = board.line_counts()
+        counts = (counts[player], counts[1 - player])
+        board_hash = AlphaBeta.root_hash(board, player)
+        results = {}
+        for a in range(len(_CELLS)):
+            if not other & _CELLS[a]:
+                results[a] = 0
+        depth = 0
+        while (max_depth is None or depth < max_depth) and 0 in results.values():
+            depth += 1
+            self.deadline = deadline
+            try:
+                for a, result in results.items():
+                    if result != 0:
+                        continue
+                    _, keep, shifted, up, down, dest = utils.ACTION_SLIDES[a]
+                    new_own = (own & keep) | (((own & shifted) << up) >> down) | dest
+                    new_other = (other & keep) | (((other & shifted) << up) >> down)
+                    own_counts = update_counts(counts[0], own, new_own, _GATHERS[a])
+                    other_counts = update_counts(counts[1], other, new_other, _GATHERS[a])
+                    if has_line(other_counts):
+                        results[a] = -1
+                    elif has_line(own_counts):
+                        results[a] = 1
+                    elif depth > 1:
+                        new_hash = (
+                            board_hash
+                            ^ hash_bits(own ^ new_own, player)
+                            ^ hash_bits(other ^ new_other, 1 - player)
+                            ^ ZOBRIST_TURN
+                        )
+                        # only the forced results matter: a window around them
+                        value = -self.search(
+                            new_other,
+                            new_own,
+                            (other_counts, own_counts),
+                            1 - player,
+                            new_hash,
+                            depth - 1,
+                            -WIN_BOUND,
+                            WIN_BOUND,
+                            1,
+                        )
+                        if value >= WIN_BOUND:
+                            results[a] = 1
+                        elif value <= -WIN_BOUND:
+                            results[a] = -1
+            except _Timeout:
+                break
+            finally:
+                self.deadline = None
+        return {utils.ACTIONS[a]: result for a, result in results.items()}
+
+
+class AlphaBetaPlayer(Player):
+    def __init__(self, max_depth=4, time_budget=None, print_board=False) -> None:
+        """Searches until max_depth or for time_budget seconds per move (None means
+        no limit, but at least one of them must be given)."""
+        super().__init__()
+        assert max_depth is not None or time_budget is not None
+        self.max_depth = max_depth
+        self.time_budget = time_budget
+        self.print_board = print_board
+        self.searcher = AlphaBeta()
+
+    def make_move(self, game: Game) -> tuple[tuple[int, int], Move]:
+        deadline = None
+        if self.time_budget is not None:
+            deadline = time.perf_counter() + self.time_budget
+        board = game.get_bitboard()
+        (cell, side), value, depth = self.searcher.best_move(
+            board, game.get_current_player(), self.max_depth, deadline
+        )
+        if self.print_board:
+            print(board)
+            print(f"AlphaBeta Player going for {cell}, {side} (value {value}, depth {depth}).")
+        return cell, side
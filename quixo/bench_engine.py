@@ -0,0 +1,297 @@
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+import numpy as np
+from game import Game
+from bitboard import BitBoard
+from mcts import MctsPlayer, RandomPlayer
+from rollout import BATCH_ROLLOUT_TAIL, random_rollout, batch_rollout
+from bench_rollout import random_positions
+import utils
+
+
+def measure(fn, items: list, min_time: float) -> tuple[int, float]:
+    """Calls fn on each item, cycling over items until min_time seconds
+    have passed. Returns the number of calls and the elapsed time."""
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for item in items:
+            fn(item)
+        calls += len(items)
+        elapsed = time.perf_counter() - start
+    return calls, elapsed
+
+
+def result(name: str, unit: str, calls: int, elapsed: float, per_call=1) -> dict:
+    return {
+        "name": name,
+        "unit": unit,
+        "rate": calls * per_call / elapsed,
+        "count": calls * per_call,
+        "seconds": elapsed,
+    }
+
+
+def bench_play(bitboard: bool, games: int, seed: int) -> dict:
+    """Full games between two random players (legal moves only)"""
+    random.seed(seed)
+    moves = 0
+    start = time.perf_counter()
+    for g in range(games):
+        game = Game(bitboard=bitboard)
+        game.current_player_idx = g % 2
+        counter = _CountingPlayer()
+        game.play(counter, counter)
+        moves += counter.moves
+    elapsed = time.perf_counter() - start
+    return result(f"Game.play[{_engine(bitboard)}]", "moves/s", moves, elapsed)
+
+
+class _CountingPlayer(RandomPlayer):
+    def __init__(self) -> None:
+        super().__init__()
+        self.moves = 0
+
+    def make_move(self, game):
+        self.moves += 1
+        return super().make_move(game)
+
+
+def _engine(bitboard: bool) -> str:
+    return "bitboard" if bitboard else "array"
+
+
+def _with_actions(positions: list, bitboard: bool, rng: random.Random) -> list:
+    """(board, turn, action) with a legal action for each position"""
+    items = []
+    for board, turn in positions:
+        if bitboard:
+            board = BitBoard.from_array(board)
+        items.append((board, turn, rng.choice(utils.get_legal_actions(board, turn))))
+    return items
+
+
+def bench_move(positions: list, bitboard: bool, rng, min_time: float) -> dict:
+    """Game.__move (validation and slide) of a legal action on each position;
+    the array boards are copied before each move, since it changes them in place"""
+    game = Game(bitboard=bitboard)
+    items = _with_actions(positions, bitboard, rng)
+
+    def move(item):
+        board, turn, (pos, slide) = item
+        game._board = board if bitboard else board.copy()
+        game._Game__move(pos, slide, turn)
+
+    calls, elapsed = measure(move, items, min_time)
+    return result(f"Game.__move[{_engine(bitboard)}]", "moves/s", calls, elapsed)
+
+
+def bench_get_new_board(positions, bitboard, rng, min_time) -> dict:
+    items = _with_actions(positions, bitboard, rng)
+    calls, elapsed = measure(lambda i: utils.get_new_board(*i), items, min_time)
+    return result(f"utils.get_new_board[{_engine(bitboard)}]", "moves/s", calls, elapsed)
+
+
+def bench_get_possible_actions(positions, bitboard, min_time) -> dict:
+    items = [
+        (BitBoard.from_array(board) if bitboard else board, turn)
+        for board, turn in positions
+    ]
+    calls, elapsed = measure(lambda i: utils.get_possible_actions(*i), items, min_time)
+    return result(
+        f"utils.get_possible_actions[{_engine(bitboard)}]", "expansions/s", calls, elapsed
+    )
+
+
+def bench_check_win(positions, bitboard, min_time) -> dict:
+    # fresh BitBoards, so that the line counts are computed by each call
+    if bitboard:
+        fn = lambda i: utils.check_win(BitBoard.decode(i[0]), i[1])
+        items = [(BitBoard.from_array(b).encode(), t) for b, t in positions]
+    else:
+        fn = lambda i: utils.check_win(*i)
+        items = positions
+    calls, elapsed = measure(fn, items, min_time)
+    return result(f"utils.check_win[{_engine(bitboard)}]", "checks/s", calls, elapsed)
+
+
+def bench_random_rollout(positions, min_time) -> dict:
+    calls, elapsed = measure(lambda i: random_rollout(*i), positions, min_time)
+    return result("rollout.random_rollout", "rollouts/s", calls, elapsed)
+
+
+def bench_batch_rollout(positions, min_time) -> dict:
+    boards = [board for board, _ in positions]
+    turns = [turn for _, turn in positions]
+    calls, elapsed = measure(lambda _: batch_rollout(boards, turns), [None], min_time)
+    return result("rollout.batch_rollout", "rollouts/s", calls, elapsed, len(positions))
+
+
+def bench_rollout_size(positions, size: int, batch: bool, min_time) -> dict:
+    """Rollouts of size boards (the positions, repeated as needed, as BitBoards as
+    in MctsPlayer.simulation), together by batch_rollout or one by one by
+    random_rollout, see rollout.BATCH_ROLLOUT_TAIL"""
+    items = [positions[i % len(positions)] for i in range(size)]
+    boards = [BitBoard.from_array(board) for board, _ in items]
+    turns = [turn for _, turn in items]
+    if batch:
+        fn, name = lambda _: batch_rollout(boards, turns), "batch_rollout"
+    else:
+        fn = lambda _: [random_rollout(b, t) for b, t in zip(boards, turns)]
+        name = "random_rollout"
+    calls, elapsed = measure(fn, [None], min_time)
+    return result(f"rollout.{name}[N={size}]", "rollouts/s", calls, elapsed, size)
+
+
+def rollout_crossover(results: list[dict], sizes: list[int]):
+    """The smallest size where batch_rollout is faster than random_rollout, or
+    None (below BATCH_ROLLOUT_TAIL, both roll out each board)"""
+    rates = {r["name"]: r["rate"] for r in results}
+    for size in sorted(s for s in sizes if s >= BATCH_ROLLOUT_TAIL):
+        batch = rates[f"rollout.batch_rollout[N={size}]"]
+        if batch >= rates[f"rollout.random_rollout[N={size}]"]:
+            return size
+    return None
+
+
+def bench_simulation(positions, simulations: int, leaf_batch: int) -> dict:
+    """MctsPlayer.simulation from the root of each position, with a fresh table"""
+    done = 0
+    start = time.perf_counter()
+    for board, turn in positions:
+        player = MctsPlayer(simulations=simulations, leaf_batch=leaf_batch)
+        root = MctsPlayer.visit_root(board, turn, player.node_table)
+        done += MctsPlayer.search(root, player.node_table, simulations, leaf_batch)
+    elapsed = time.perf_counter() - start
+    name = f"MctsPlayer.simulation[leaf_batch={leaf_batch}]"
+    return result(name, "simulations/s", done, elapsed)
+
+
+def bench_neural(positions, min_time) -> dict:
+    import torch
+    from agent import NeuralPlayer, Policy
+
+    torch.manual_seed(0)
+    player = NeuralPlayer(Policy(), train=False)
+    games = []
+    for board, turn in positions:
+        game = Game()
+        game._board = board
+        game.current_player_idx = turn
+        games.append(game)
+    calls, elapsed = measure(player.make_move, games, min_time)
+    return result("NeuralPlayer.make_move", "inferences/s", calls, elapsed)
+
+
+def revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(results: list[dict], baseline: dict, threshold: float) -> bool:
+    """Prints the ratio to the baseline of each benchmark; returns False if
+    one of them is slower than (1 - threshold) times the baseline"""
+    ok = True
+    rates = {r["name"]: r["rate"] for r in baseline["results"]}
+    for r in results:
+        if r["name"] not in rates:
+            continue
+        ratio = r["rate"] / rates[r["name"]]
+        regression = ratio < 1 - threshold
+        ok = ok and not regression
+        print(f"{r['name']:45s} {ratio:6.2f}x" + ("  REGRESSION" if regression else ""))
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--positions", type=int, default=50)
+    parser.add_argument("--plies", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min_time", type=float, default=1.0, help="seconds per benchmark")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--simulations", type=int, default=200)
+    parser.add_argument(
+        "--rollout_sizes",
+        type=int,
+        nargs="+",
+        default=[16, 32, 64, 128, 256],
+        help="batch sizes of the comparison of batch_rollout and random_rollout",
+    )
+    parser.add_argument("--no_neural", action="store_true")
+    parser.add_argument("--output", type=str, default=None, help="JSON file")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON file to compare to")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    positions = random_positions(args.positions, args.plies, rng)
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+
+    benchmarks = []
+    for bitboard in (False, True):
+        benchmarks += [
+            lambda b=bitboard: bench_play(b, args.games, args.seed),
+            lambda b=bitboard: bench_move(positions, b, random.Random(args.seed), args.min_time),
+            lambda b=bitboard: bench_get_new_board(
+                positions, b, random.Random(args.seed), args.min_time
+            ),
+            lambda b=bitboard: bench_get_possible_actions(positions, b, args.min_time),
+            lambda b=bitboard: bench_check_win(positions, b, args.min_time),
+        ]
+    benchmarks += [
+        lambda: bench_random_rollout(positions, args.min_time),
+        lambda: bench_batch_rollout(positions, args.min_time),
+    ]
+    for size in args.rollout_sizes:
+        benchmarks += [
+            lambda n=size, b=batch: bench_rollout_size(positions, n, b, args.min_time)
+            for batch in (False, True)
+        ]
+    benchmarks += [
+        lambda: bench_simulation(positions[:5], args.simulations, 1),
+        lambda: bench_simulation(positions[:5], args.simulations, 16),
+    ]
+    if not args.no_neural:
+        benchmarks.append(lambda: bench_neural(positions, args.min_time))
+
+    results = []
+    for benchmark in benchmarks:
+        r = benchmark()
+        print(f"{r['name']:45s} {r['rate']:12.1f} {r['unit']}", flush=True)
+        results.append(r)
+    crossover = rollout_crossover(results, args.rollout_sizes)
+    if crossover is not None:
+        print(f"batch_rollout is faster than random_rollout from N={crossover}", end="")
+    else:
+        largest = max(args.rollout_sizes)
+        print(f"batch_rollout is slower than random_rollout up to N={largest}", end="")
+    print(f" (batch_rollout plays less than {BATCH_ROLLOUT_TAIL} games one by one)")
+
+    report = {
+        "revision": revision(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "options": vars(args),
+        "results": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared to {args.baseline} ({baseline.get('revision', '')}):")
+        if not compare(results, baseline, args.threshold):
+            exit(1)
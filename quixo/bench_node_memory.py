@@ -0,0 +1,61 @@
+import argparse
+import random
+import tracemalloc
+import numpy as np
+from game import Game
+from mcts_node import MctsNode
+import utils
+
+
+class DictNode:
+    """The layout of MctsNode before __slots__: a __dict__, the board as a
+    25-tuple and a list of children per node"""
+
+    def __init__(self, board: np.ndarray, player_id):
+        self.board: tuple = tuple(board.ravel())
+        self.turn: int = player_id
+        self.parent = None
+        self.action = None
+        self.visited: bool = False
+        self.children: list = []
+        self.minimax_evaluated: int = -1
+        self.minimax_value: int = -1
+        self.simulations: int = 0
+        self.wins: int = 0
+
+
+def random_boards(n: int, rng: random.Random):
+    boards = []
+    while len(boards) < n:
+        board, turn = Game().get_board(), 0
+        while utils.check_win(board, turn) == -1 and len(boards) < n:
+            board = utils.get_new_board(
+                board, turn, rng.choice(utils.get_legal_actions(board, turn))
+            )
+            turn = 1 - turn
+            boards.append((board, turn))
+    return boards
+
+
+def bytes_per_node(node_class, boards) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    nodes = [node_class(board, turn) for board, turn in boards]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # the list holding the nodes is not part of the nodes
+    return (after - before) / len(nodes) - 8
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    boards = random_boards(args.nodes, random.Random(args.seed))
+    before = bytes_per_node(DictNode, boards)
+    after = bytes_per_node(MctsNode, boards)
+    print(f"Before (__dict__, tuple board): {before:6.1f} bytes per node")
+    print(f"After (__slots__, int board):   {after:6.1f} bytes per node")
+    print(f"Saving: {1 - after / before:.0%}")
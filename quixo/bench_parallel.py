@@ -0,0 +1,36 @@
+import argparse
+import random
+import time
+import numpy as np
+from game import Game
+from mcts import MctsPlayer, RandomPlayer
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--parallel", type=str, default="root", choices=["root", "leaf"])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--simulations", type=int, default=300)
+    parser.add_argument("--test_episodes", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+        player = MctsPlayer(
+            simulations=args.simulations, workers=workers, parallel=args.parallel
+        )
+        wins = 0
+        start = time.perf_counter()
+        for episode in range(args.test_episodes):
+            game = Game()
+            game.current_player_idx = episode % 2
+            if game.play(player, RandomPlayer()) == 0:
+                wins += 1
+        elapsed = time.perf_counter() - start
+        player.close()
+        print(
+            f"{args.parallel} parallel, {workers} workers: "
+            f"{player.playouts / elapsed:8.1f} playouts/s, "
+            f"win rate {wins / args.test_episodes:.2f} ({wins}/{args.test_episodes})"
+        )
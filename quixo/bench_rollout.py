@@ -0,0 +1,66 @@
+import argparse
+import random
+import time
+import numpy as np
+from game import Game
+from mcts import RandomPlayer
+from rollout import random_rollout
+import utils
+
+
+def game_rollout(board, turn):
+    """The rollout as it was done before rollout.py: a full Game.play between
+    two RandomPlayer"""
+    game = Game()
+    game.current_player_idx = turn
+    game._board = board
+    return game.play(RandomPlayer(), RandomPlayer())
+
+
+def random_positions(n: int, plies: int, rng: random.Random):
+    """Non-terminal positions reached after `plies` random moves"""
+    positions = []
+    while len(positions) < n:
+        board, turn = Game().get_board(), 0
+        for _ in range(plies):
+            board = utils.get_new_board(
+                board, turn, rng.choice(utils.get_legal_actions(board, turn))
+            )
+            turn = 1 - turn
+            if utils.check_win(board, turn) != -1:
+                break
+        else:
+            positions.append((board, turn))
+    return positions
+
+
+def run(rollout, positions, repetitions):
+    wins = 0
+    start = time.perf_counter()
+    for board, turn in positions:
+        for _ in range(repetitions):
+            wins += rollout(board.copy(), turn) == 0
+    elapsed = time.perf_counter() - start
+    return len(positions) * repetitions / elapsed, wins / (len(positions) * repetitions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--positions", type=int, default=20)
+    parser.add_argument("--plies", type=int, default=8)
+    parser.add_argument("--repetitions", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    positions = random_positions(args.positions, args.plies, random.Random(args.seed))
+    n = args.positions * args.repetitions
+    game_speed, game_rate = run(game_rollout, positions, args.repetitions)
+    fast_speed, fast_rate = run(random_rollout, positions, args.repetitions)
+    # two-proportion z statistic: both paths should have the same win rate
+    p = (game_rate + fast_rate) / 2
+    z = (game_rate - fast_rate) / np.sqrt(2 * p * (1 - p) / n)
+
+    print(f"Game.play rollouts: {game_speed:10.1f} rollouts/s, player 0 wins {game_rate:.3f}")
+    print(f"random_rollout:     {fast_speed:10.1f} rollouts/s, player 0 wins {fast_rate:.3f}")
+    print(f"Speedup: {fast_speed / game_speed:.1f}x, win rate difference z = {z:+.2f}")
@@ -0,0 +1,305 @@
+import numpy as np
+
+# A Quixo board is stored as two 25-bit integers, one per player:
+# bit y * 5 + x is set in bits[p] when the cell in row y, column x
+# (ie board[y, x] in the array representation) belongs to player p.
+# Neutral cells are the ones that are not set in either integer.
+
+FULL = (1 << 25) - 1
+# value of each bit, to convert NumPy boards with a dot product
+_POWERS = np.left_shift(1, np.arange(25, dtype=np.int64))
+
+
+def cell_bit(x: int, y: int) -> int:
+    return 1 << (y * 5 + x)
+
+
+ROWS = [sum(cell_bit(x, y) for x in range(5)) for y in range(5)]
+COLUMNS = [sum(cell_bit(x, y) for y in range(5)) for x in range(5)]
+DIAGONAL = sum(cell_bit(i, i) for i in range(5))
+ANTI_DIAGONAL = sum(cell_bit(4 - i, i) for i in range(5))
+# the 12 winning lines
+LINES = ROWS + COLUMNS + [DIAGONAL, ANTI_DIAGONAL]
+
+# lines in the order in which Game.check_winner scans them: the last complete
+# line of each group wins, and the scan stops after a group if the winner is
+# not the player who has just moved
+GAME_LINE_GROUPS = [ROWS, COLUMNS, [DIAGONAL], [ANTI_DIAGONAL]]
+# lines in the order in which utils.check_win scans them: the last complete
+# line wins
+UTILS_LINE_ORDER = [
+    line for i in range(5) for line in (ROWS[i], COLUMNS[i])
+] + [DIAGONAL, ANTI_DIAGONAL]
+
+
+def _mask(cells) -> int:
+    return sum(cell_bit(x, y) for x, y in cells)
+
+
+def _slide_table() -> dict:
+    """For each legal (x, y, side) returns (keep, shifted, up, down, dest):
+    the bits outside the slid segment, the bits that are shifted by one cell,
+    the left and right shift amounts and the bit where the taken piece lands.
+    Sides follow game.Move: TOP = 0, BOTTOM = 1, LEFT = 2, RIGHT = 3."""
+    table = {}
+    for x in range(5):
+        for y in range(5):
+            if x not in {0, 4} and y not in {0, 4}:
+                continue
+            forbidden = set()
+            if x == 0:
+                forbidden.add(2)
+            if x == 4:
+                forbidden.add(3)
+            if y == 0:
+                forbidden.add(0)
+            if y == 4:
+                forbidden.add(1)
+            for side in {0, 1, 2, 3} - forbidden:
+                if side == 0:
+                    # the column above the piece moves down by one row
+                    segment = [(x, i) for i in range(0, y + 1)]
+                    shifted = _mask((x, i) for i in range(0, y))
+                    up, down, dest = 5, 0, cell_bit(x, 0)
+                elif side == 1:
+                    # the column below the piece moves up by one row
+                    segment = [(x, i) for i in range(y, 5)]
+                    shifted = _mask((x, i) for i in range(y + 1, 5))
+                    up, down, dest = 0, 5, cell_bit(x, 4)
+                elif side == 2:
+                    # the row left of the piece moves right by one column
+                    segment = [(i, y) for i in range(0, x + 1)]
+                    shifted = _mask((i, y) for i in range(0, x))
+                    up, down, dest = 1, 0, cell_bit(0, y)
+                else:
+                    # the row right of the piece moves left by one column
+                    segment = [(i, y) for i in range(x, 5)]
+                    shifted = _mask((i, y) for i in range(x + 1, 5))
+                    up, down, dest = 0, 1, cell_bit(4, y)
+                keep = FULL & ~_mask(segment)
+                table[(x, y, side)] = (keep, shifted, up, down, dest)
+    return table
+
+
+SLIDES = _slide_table()
+
+
+def slide(own: int, other: int, x: int, y: int, side: int) -> tuple[int, int]:
+    """Moves the piece in (x, y) for the owner of `own`. Assumes the move is valid."""
+    keep, shifted, up, down, dest = SLIDES[(x, y, side)]
+    own = (own & keep) | (((own & shifted) << up) >> down) | dest
+    other = (other & keep) | (((other & shifted) << up) >> down)
+    return own, other
+
+
+def is_valid(own: int, other: int, x: int, y: int, side: int) -> bool:
+    """A move is valid if it is a border move and the taken piece is not the opponent's."""
+    return (x, y, side) in SLIDES and not other & cell_bit(x, y)
+
+
+# Line counts: the pieces of a player in each of the 12 LINES, packed in a single
+# integer with 4 bits per line (line l in the bits 4l to 4l + 3). Each slide changes
+# a single row or column, so the counts are updated from the old and new contents of
+# that row or column, and a complete line is found with one addition.
+_ONES = sum(1 << 4 * l for l in range(12))
+_HIGH = 8 * _ONES
+
+
+def _line_counts(bits: int) -> int:
+    return sum((bits & line).bit_count() << 4 * l for l, line in enumerate(LINES))
+
+
+def _count_table(cells: list[int]) -> list[int]:
+    """table[v] is the line counts of the bits v of cells (bit i of v is cells[i])"""
+    return [
+        _line_counts(sum(cell for i, cell in enumerate(cells) if v >> i & 1))
+        for v in range(32)
+    ]
+
+
+# multiplying the bits of a column (shifted to column 0) by _GATHER_COLUMN moves
+# them to bits 20-24, with no overlaps between the partial products
+_GATHER_COLUMN = sum(1 << 20 - 4 * i for i in range(5))
+# for each row and column: (shift, mask, multiplier, shift, line counts table),
+# see update_counts
+ROW_GATHERS = [
+    (5 * y, 31, 1, 0, _count_table([cell_bit(x, y) for x in range(5)]))
+    for y in range(5)
+]
+COLUMN_GATHERS = [
+    (x, COLUMNS[0], _GATHER_COLUMN, 20, _count_table([cell_bit(x, y) for y in range(5)]))
+    for x in range(5)
+]
+# the row or column changed by each slide
+SLIDE_GATHERS = {
+    (x, y, side): COLUMN_GATHERS[x] if side < 2 else ROW_GATHERS[y]
+    for x, y, side in SLIDES
+}
+
+
+_ROW_COUNTS = [gather[4] for gather in ROW_GATHERS]
+
+
+def line_counts(bits: int) -> int:
+    table = _ROW_COUNTS
+    return (
+        table[0][bits & 31]
+        + table[1][bits >> 5 & 31]
+        + table[2][bits >> 10 & 31]
+        + table[3][bits >> 15 & 31]
+        + table[4][bits >> 20 & 31]
+    )
+
+
+def update_counts(counts: int, old: int, new: int, gather) -> int:
+    """Line counts of new, given the counts of old, when old and new only
+    differ in the row or column of gather (see SLIDE_GATHERS)"""
+    shift, mask, multiplier, down, table = gather
+    return (
+        counts
+        - table[((old >> shift & mask) * multiplier >> down) & 31]
+        + table[((new >> shift & mask) * multiplier >> down) & 31]
+    )
+
+
+def has_line(counts: int) -> bool:
+    """True if a line is complete: a count of 5, plus 3, sets the bit 3 of its field"""
+    return (counts + 3 * _ONES) & _HIGH != 0
+
+
+def longest_line(counts: int) -> int:
+    """The largest count (the counts are at most 5, so the fields never overflow)"""
+    for k in range(5, 0, -1):
+        if (counts + (8 - k) * _ONES) & _HIGH:
+            return k
+    return 0
+
+
+def check_win(bits0: int, bits1: int) -> int:
+    """Same semantics as utils.check_win"""
+    winner = -1
+    for line in UTILS_LINE_ORDER:
+        if bits0 & line == line:
+            winner = 0
+        elif bits1 & line == line:
+            winner = 1
+    return winner
+
+
+def check_winner(bits0: int, bits1: int, current_player: int) -> int:
+    """Same semantics as Game.check_winner"""
+    winner = -1
+    for group in GAME_LINE_GROUPS:
+        for line in group:
+            if bits0 & line == line:
+                winner = 0
+            elif bits1 & line == line:
+                winner = 1
+        if winner > -1 and winner != current_player:
+            return winner
+    return winner
+
+
+def batch_bits(boards: np.ndarray) -> np.ndarray:
+    """The bits of a batch of NumPy boards (N, 5, 5) or (N, 25), as an (N, 2) array"""
+    flat = boards.reshape(len(boards), 25)
+    return np.stack([(flat == 0) @ _POWERS, (flat == 1) @ _POWERS], axis=1)
+
+
+def encode(board) -> int:
+    """Encodes a NumPy board or a BitBoard as a single 50-bit integer"""
+    if not isinstance(board, BitBoard):
+        board = BitBoard.from_array(board)
+    return board.encode()
+
+
+class BitBoard:
+    """Immutable Quixo board backed by two 25-bit integers.
+    It can be indexed as board[y, x] like the NumPy board."""
+
+    __slots__ = ("bits", "counts")
+
+    def __init__(self, bits: tuple[int, int] = (0, 0), counts: tuple[int, int] = None):
+        self.bits = bits
+        # line counts of the two players, computed when they are first needed
+        # and then updated by move
+        self.counts = counts
+
+    @staticmethod
+    def from_array(board: np.ndarray) -> "BitBoard":
+        flat = board.ravel()
+        return BitBoard((int((flat == 0) @ _POWERS), int((flat == 1) @ _POWERS)))
+
+    @staticmethod
+    def decode(key: int) -> "BitBoard":
+        return BitBoard((key & FULL, key >> 25))
+
+    def encode(self) -> int:
+        """The board as a single 50-bit integer"""
+        return self.bits[0] | self.bits[1] << 25
+
+    def to_array(self) -> np.ndarray:
+        board = np.full(25, -1, dtype=np.int16)
+        board[(self.bits[0] & _POWERS) != 0] = 0
+        board[(self.bits[1] & _POWERS) != 0] = 1
+        return board.reshape(5, 5)
+
+    def __getitem__(self, pos: tuple[int, int]) -> int:
+        bit = 1 << (pos[0] * 5 + pos[1])
+        if self.bits[0] & bit:
+            return 0
+        if self.bits[1] & bit:
+            return 1
+        return -1
+
+    def __eq__(self, other: "BitBoard"):
+        return isinstance(other, BitBoard) and self.bits == other.bits
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def __str__(self):
+        return str(self.to_array())
+
+    def is_valid(self, my_id: int, action) -> bool:
+        (x, y), move = action
+        return is_valid(self.bits[my_id], self.bits[1 - my_id], x, y, move.value)
+
+    def move(self, my_id: int, action) -> "BitBoard":
+        """Returns the board after the action. Assumes the action is valid"""
+        (x, y), move = action
+        bits = slide(self.bits[my_id], self.bits[1 - my_id], x, y, move.value)
+        if my_id == 1:
+            bits = (bits[1], bits[0])
+        counts = None
+        if self.counts is not None:
+            gather = SLIDE_GATHERS[(x, y, move.value)]
+            counts = tuple(
+                update_counts(self.counts[p], self.bits[p], bits[p], gather)
+                for p in (0, 1)
+            )
+        return BitBoard(bits, counts)
+
+    def line_counts(self) -> tuple[int, int]:
+        if self.counts is None:
+            self.counts = (line_counts(self.bits[0]), line_counts(self.bits[1]))
+        return self.counts
+
+    def longest_line(self, player: int) -> int:
+        """The most pieces of player in a line"""
+        return longest_line(self.line_counts()[player])
+
+    def check_win(self) -> int:
+        counts = self.line_counts()
+        win0, win1 = has_line(counts[0]), has_line(counts[1])
+        if win0 and win1:
+            # the result depends on the order of the lines
+            return check_win(*self.bits)
+        return 0 if win0 else 1 if win1 else -1
+
+    def check_winner(self, current_player: int) -> int:
+        counts = self.line_counts()
+        win0, win1 = has_line(counts[0]), has_line(counts[1])
+        if win0 and win1:
+            return check_winner(*self.bits, current_player)
+        return 0 if win0 else 1 if win1 else -1
@@ -0,0 +1,17 @@
+import argparse
+import torch
+from agent import export_policy, load_policy
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--policy", type=str, required=True, help="Policy checkpoint")
+    parser.add_argument("--output", type=str, required=True, help="TorchScript file")
+    args = parser.parse_args()
+
+    policy = load_policy(args.policy)
+    export_policy(policy, args.output)
+    # the export must give the same probabilities as the checkpoint
+    x = torch.randint(-1, 2, (8, 25), dtype=torch.float32)
+    for expected, exported in zip(policy(x), torch.jit.load(args.output)(x)):
+        assert torch.allclose(expected, exported)
+    print(f"Exported {args.policy} to {args.output}.")
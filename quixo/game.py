@@ -2,6 +2,8 @@ from abc import ABC, abstractmethod
 from copy import deepcopy
 from enum import Enum
 import numpy as np
+from bitboard import BitBoard
+from zobrist import SEGMENTS, update_hash, update_hash_cells
 
 # Rules on PDF and https://cdn.1j1ju.com/medias/a8/5e/26-quixo-rulebook.pdf
 
@@ -34,16 +36,39 @@ class Player(ABC):
 
 
 class Game(object):
-    def __init__(self) -> None:
-        self._board = np.ones((5, 5), dtype=np.uint8) * -1
+    def __init__(self, bitboard: bool = False) -> None:
+        '''With bitboard=True the board is stored as a BitBoard (two 25-bit integers)
+        instead of a NumPy array, the public API is the same'''
+        if bitboard:
+            self._board = BitBoard()
+        else:
+            self._board = np.ones((5, 5), dtype=np.uint8) * -1
         self.current_player_idx = 1
+        # Zobrist hash of the board (see zobrist.py), updated by each move
+        self._hash = 0
 
     def get_board(self) -> np.ndarray:
         '''
         Returns the board
         '''
+        if isinstance(self._board, BitBoard):
+            return self._board.to_array()
         return deepcopy(self._board)
 
+    def get_bitboard(self) -> BitBoard:
+        '''
+        Returns the board as a BitBoard, without copies if the game runs on bitboards
+        '''
+        if isinstance(self._board, BitBoard):
+            return self._board
+        return BitBoard.from_array(self._board)
+
+    def get_hash(self) -> int:
+        '''
+        Returns the Zobrist hash of the board
+        '''
+        return self._hash
+
     def get_current_player(self) -> int:
         '''
         Returns the current player
@@ -52,10 +77,12 @@ class Game(object):
 
     def print(self):
         '''Prints the board. -1 are neutral pieces, 0 are pieces of player 0, 1 pieces of player 1'''
-        print(self._board)
+        print(self.get_board())
 
     def check_winner(self) -> int:
         '''Check the winner. Returns the player ID of the winner if any, otherwise returns -1'''
+        if isinstance(self._board, BitBoard):
+            return self._board.check_winner(self.current_player_idx)
         # for each row
         player = self.get_current_player()
         winner = -1
@@ -92,11 +119,16 @@ class Game(object):
             winner = self._board[0, -1]
         return winner
 
-    def play(self, player1: Player, player2: Player) -> int:
-        '''Play the game. Returns the winning player'''
+    def play(self, player1: Player, player2: Player, max_plies: int = None) -> int:
+        '''Play the game. Returns the winning player, or -1 (a draw) if
+        max_plies moves were played without a winner (None means no limit)'''
         players = [player1, player2]
         winner = -1
+        plies = 0
         while winner < 0:
+            if max_plies is not None and plies == max_plies:
+                break
+            plies += 1
             self.current_player_idx += 1
             self.current_player_idx %= len(players)
             ok = False
@@ -111,13 +143,28 @@ class Game(object):
         '''Perform a move'''
         if player_id > 2:
             return False
+        if isinstance(self._board, BitBoard):
+            acceptable = self._board.is_valid(player_id, (from_pos, slide))
+            if acceptable:
+                board = self._board.move(player_id, (from_pos, slide))
+                self._hash = update_hash(self._hash, self._board, board)
+                self._board = board
+            return acceptable
         # Oh God, Numpy arrays
+        # the cells that the move would change, to update the hash
+        cells = SEGMENTS.get((from_pos[0], from_pos[1], slide.value))
+        if cells is not None:
+            prev_values = self._board.ravel()[cells]
         prev_value = deepcopy(self._board[(from_pos[1], from_pos[0])])
         acceptable = self.__take((from_pos[1], from_pos[0]), player_id)
         if acceptable:
             acceptable = self.__slide((from_pos[1], from_pos[0]), slide)
             if not acceptable:
                 self._board[(from_pos[1], from_pos[0])] = deepcopy(prev_value)
+        if acceptable:
+            self._hash = update_hash_cells(
+                self._hash, cells, prev_values, self._board.ravel()[cells]
+            )
         return acceptable
 
     def __take(self, from_pos: tuple[int, int], player_id: int) -> bool:
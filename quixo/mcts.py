@@ -1,45 +1,137 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING
 from game import Game, Player, Move
+from bitboard import BitBoard
 import utils
 from mcts_node import MctsNode
+from transposition import TranspositionTable
+from rollout import random_rollout, batch_rollout
+from alphabeta import AlphaBeta
+from opening_book import OpeningBook
 import numpy as np
 import random
+import time
+
+if TYPE_CHECKING:
+    # puct loads torch: it is only imported by the players with a policy
+    from puct import Puct
 
 
 class MctsPlayer(Player):
-    def __init__(self, print_board=False):
+    def __init__(
+        self,
+        print_board=False,
+        leaf_batch=1,
+        simulations=300,
+        workers=1,
+        parallel="root",
+        time_budget=None,
+        node_budget=None,
+        max_nodes=None,
+        eviction="lru",
+        reuse_table=False,
+        symmetry=False,
+        zobrist=False,
+        solver="minimax",
+        solver_depth=4,
+        policy=None,
+        c_puct=1.5,
+        policy_rollouts=False,
+        book=None,
+    ):
+        """With leaf_batch > 1, leaf_batch leaves are selected and rolled out
+        together in each simulation (see simulation). batch_rollout is faster
+        than rolling out the leaves one by one from about 64 leaves (see
+        bench_engine.py); below that a batch costs about the same, and what it
+        buys is the batching of the PUCT priors and of the leaf workers.
+        simulations is the number of simulations per move of each search tree.
+        The search of a move stops as soon as one of the budgets is used up:
+        simulations, time_budget (seconds since the start of make_move) or
+        node_budget (new nodes in the node table); None means no limit.
+        The node table holds at most max_nodes nodes (None means no limit), see
+        TranspositionTable for the eviction policies. With reuse_table=True the
+        node table is kept from one game to the next. With symmetry=True, the
+        rotations and reflections of a board share the same node. With zobrist=True,
+        the node table keys on Zobrist hashes.
+        With workers > 1 the search runs on a pool of processes:
+        - parallel="root": each worker grows its own tree and the statistics of
+          the root children are merged (root parallelism);
+        - parallel="leaf": there is only one tree, and the rollouts of batches of
+          at least `workers` leaves are run by the workers (leaf parallelism).
+        Before the search, the children of the root are solved by a depth 4 minimax
+        (solver="minimax") or by an alpha-beta search with iterative deepening until
+        solver_depth (solver="alphabeta"), see visit_root.
+        If a policy (agent.Policy, or a TorchScript export) is given, the children
+        are selected by PUCT with the priors of the policy instead of UCB, and with
+        policy_rollouts=True the rollouts are played by the policy (see puct.py);
+        the priors of the leaves of a batch (leaf_batch) take one forward pass.
+        The positions found in the opening book (an OpeningBook or the path of its
+        file, see opening_book.py) are played without searching."""
+        assert parallel in {"root", "leaf"}
+        assert solver in {"minimax", "alphabeta"}
         self.print_board = print_board
-        self.node_table: dict[tuple[tuple[int], int], MctsNode] = {}
+        self.leaf_batch = leaf_batch
+        self.simulations = simulations
+        self.workers = workers
+        self.parallel = parallel
+        self.time_budget = time_budget
+        self.node_budget = node_budget
+        assert simulations is not None or time_budget is not None or node_budget is not None
+        self.executor = None
+        # total number of simulations (over all the workers)
+        self.playouts = 0
+        # simulations done and time spent (seconds) for each move
+        self.move_stats: list[dict] = []
+        self.node_table = TranspositionTable(max_nodes, eviction, symmetry, zobrist)
+        self.reuse_table = reuse_table
+        self.solver = solver
+        self.solver_depth = solver_depth
+        self.alphabeta = AlphaBeta() if solver == "alphabeta" else None
+        self.puct = None
+        if policy is not None:
+            from puct import Puct
+
+            self.puct = Puct(policy, c_puct, policy_rollouts)
+        if isinstance(book, str):
+            book = OpeningBook(book)
+        self.book = book
+        # pieces on the board at the previous move, to detect a new game
+        self.pieces = 0
 
     @staticmethod
-    def minimax(node: MctsNode, node_table, depth=2):
+    def minimax(node: MctsNode, node_table, depth=2, deadline=None):
+        """If the time.perf_counter() deadline is reached, the search is cut short:
+        the unexplored nodes are unknown (-1) and the result is not stored."""
         if node.get_minimax_evaluated() >= depth or node.get_minimax_value() != -1:
             return node.get_minimax_value()
+        if deadline is not None and time.perf_counter() >= deadline:
+            return -1
 
-        board, turn = node.get_board(), node.get_turn()
+        board, turn = node.get_bitboard(), node.get_turn()
         winner = utils.check_win(board, turn)
         if winner == -1 and utils.win_possible(board, turn, depth):
             winner = (turn + 1) % 2
             child_boards, _ = utils.get_possible_actions(board, turn)
             for child_board in child_boards:
                 child = utils.lookup_node(child_board, (turn + 1)%2, node_table)
-                value = MctsPlayer.minimax(child, node_table, depth=depth - 1)
+                value = MctsPlayer.minimax(
+                    child, node_table, depth=depth - 1, deadline=deadline
+                )
                 if value == turn:
                     winner = turn
                     break
                 elif value == -1:
                     winner = -1
 
-        node.set_minimax_value(winner, depth)
+        if deadline is None or time.perf_counter() < deadline:
+            node.set_minimax_value(winner, depth)
         return winner
 
     @staticmethod
     def rollout(board, turn):
-        """board will be changed by this function"""
-        game = Game()
-        player1, player2 = RandomPlayer(), RandomPlayer()
-        game.current_player_idx = turn
-        game._board = board
-        return game.play(player1, player2)
+        """Same as playing a Game between two RandomPlayer, with
+        current_player_idx = turn, but on a bitboard (see rollout.py)"""
+        return random_rollout(board, turn)
 
     @staticmethod
     def backpropagation(node: MctsNode, win_id: int):
@@ -59,17 +151,17 @@ class MctsPlayer(Player):
             node.add_wins()
 
     @staticmethod
-    def simulation(
+    def selection(
         root: MctsNode,
-        node_table: dict[np.ndarray : MctsNode],
+        node_table: TranspositionTable,
+        puct: "Puct" = None,
+        expansions=None,
     ):
-        """IMPORTANT: this function assumes root node has been visited.
-        This is because the "actions" of the children must be initialized and
-        I want this to be dealt with outside this function, which does not
-        initialize actions but only execute simulations."""
-
+        """Descends the tree from root, and returns the list of the traversed nodes:
+        the last one is the leaf to be evaluated. The children are chosen by UCB, or
+        by puct if given. If expansions is a list, the expanded node is appended to it
+        with the index of the child reached by each of its actions (see Puct.evaluate)."""
         end = False
-        winner = -1
         current_node = root
         player = root.get_turn()
         traversed = [root]
@@ -77,14 +169,19 @@ class MctsPlayer(Player):
         while not end:
             # if node has not been visited, visit it and run the simulation
             if not current_node.get_visited():
-                board, turn = current_node.get_board(), current_node.get_turn()
+                node_table.set_path(traversed)
+                board, turn = current_node.get_bitboard(), current_node.get_turn()
                 child_boards, _ = utils.get_possible_actions(board, turn)
-                children = []
+                children, child_index = [], []
                 for child_board in child_boards:
                     child = utils.lookup_node(child_board, (turn+1)%2, node_table)
                     if child not in children:
                         children.append(child)
+                    if expansions is not None:
+                        child_index.append(children.index(child))
                 current_node.set_visited(children)
+                if expansions is not None:
+                    expansions.append((current_node, board, child_index))
                 end = True
             # else, check if we can end the traversal here (ie the node is terminal)
             elif (
@@ -92,6 +189,16 @@ class MctsPlayer(Player):
                 or current_node.get_minimax_value() != -1
             ):
                 end = True
+            elif puct is not None:
+                child = puct.select(current_node, player)
+                # a child that has never been simulated is the leaf
+                end = child.get_simulations() == 0
+                if child in traversed:
+                    end = True
+                else:
+                    child.set_parent(current_node)
+                    current_node = child
+                    traversed.append(current_node)
             # else, the node has been visited and it is time to ROLLOUT!
             else:
                 children = current_node.get_children()
@@ -123,36 +230,243 @@ class MctsPlayer(Player):
                     current_node = child
                     traversed.append(current_node)
 
-        MctsPlayer.minimax(current_node, node_table, depth=0)
-        winner = current_node.get_minimax_value()
-        if winner == -1:
-            winner = MctsPlayer.rollout(current_node.get_board(), current_node.turn)
+        return traversed
 
-        MctsPlayer.backpropagation(current_node, winner)
+    @staticmethod
+    def simulation(
+        root: MctsNode,
+        node_table: TranspositionTable,
+        batch_size=1,
+        executor=None,
+        puct: "Puct" = None,
+    ):
+        """IMPORTANT: this function assumes root node has been visited.
+        This is because the "actions" of the children must be initialized and
+        I want this to be dealt with outside this function, which does not
+        initialize actions but only execute simulations.
+        With batch_size > 1, batch_size leaves are selected first (with a virtual
+        loss on the traversed nodes, so that they are not all the same), then
+        they are rolled out together by batch_rollout (or by the workers of
+        executor, if given) and backpropagated.
+        With puct, the children are selected by PUCT and the priors of the expanded
+        nodes are computed together, after the selection of the batch."""
+        node_table.start_simulation()
 
-    def make_move(self, game: Game) -> tuple[tuple[int, int], Move]:
-        board = game.get_board()
-        board_ = tuple(board.ravel())
-        turn = game.get_current_player()
-        if (board_, turn) not in self.node_table.keys():
+        if batch_size == 1 and puct is None:
+            current_node = MctsPlayer.selection(root, node_table)[-1]
+            MctsPlayer.minimax(current_node, node_table, depth=0)
+            winner = current_node.get_minimax_value()
+            if winner == -1:
+                winner = MctsPlayer.rollout(
+                    current_node.get_bitboard(), current_node.get_turn()
+                )
+            MctsPlayer.backpropagation(current_node, winner)
+            return
+
+        paths = []
+        expansions = [] if puct is not None else None
+        for _ in range(batch_size):
+            path = MctsPlayer.selection(root, node_table, puct, expansions)
+            for node in path:
+                node.add_simulations()
+            paths.append(path)
+        if puct is not None:
+            puct.evaluate(expansions)
+        winners = []
+        for path in paths:
+            for node in path:
+                node.add_simulations(-1)
+            MctsPlayer.minimax(path[-1], node_table, depth=0)
+            winners.append(path[-1].get_minimax_value())
+        to_rollout = [i for i, winner in enumerate(winners) if winner == -1]
+        if len(to_rollout) > 0:
+            boards = [paths[i][-1].get_bitboard() for i in to_rollout]
+            turns = [paths[i][-1].get_turn() for i in to_rollout]
+            if puct is not None and puct.rollouts:
+                results = puct.rollout(boards, turns)
+            elif executor is not None:
+                results = executor.map(random_rollout, boards, turns)
+            elif len(boards) == 1:
+                results = [random_rollout(boards[0], turns[0])]
+            else:
+                results = batch_rollout(boards, turns)
+            for i, winner in zip(to_rollout, results):
+                winners[i] = int(winner)
+        for path, winner in zip(paths, winners):
+            # the parents may have been changed by the following selections
+            for parent, child in zip(path, path[1:]):
+                child.set_parent(parent)
+            MctsPlayer.backpropagation(path[-1], winner)
+
+    @staticmethod
+    def visit_root(
+        board: np.ndarray,
+        turn: int,
+        node_table: TranspositionTable,
+        deadline=None,
+        alphabeta: AlphaBeta = None,
+        solver_depth=4,
+        puct: "Puct" = None,
+    ) -> MctsNode:
+        """Returns the root node for board, visited and with the actions of its children
+        initialized, and evaluated by minimax (until the deadline, if any).
+        If alphabeta is given, it looks for forced wins and losses after each action
+        instead of the minimax, up to solver_depth plies. With puct, the priors of
+        the children are set."""
+        # the nodes looked up until set_root are protected as in a simulation
+        node_table.start_simulation()
+        root = utils.lookup_node(board, turn, node_table, create=False)
+        if root is None:
             root = MctsNode(board, turn)
-        else:
-            root = self.node_table[(board_, turn)]
 
         # visit root
         # this should be done even if root had been visited before,
         # so that I can initalize the actions
-        board, turn = root.get_board(), root.get_turn()
+        # (on the actual board: the board of the node may be a symmetric one)
+        board = BitBoard.from_array(board)
         child_boards, actions = utils.get_possible_actions(board, turn)
-        children = []
+        children, child_index = [], []
         for i, child_board in enumerate(child_boards):
-            child = utils.lookup_node(child_board, (turn+1)%2, self.node_table)
+            child = utils.lookup_node(child_board, (turn+1)%2, node_table)
             if child not in children:
                 children.append(child)
+            child_index.append(children.index(child))
             child.set_action(actions[i])
         root.set_visited(children)
-        MctsPlayer.minimax(root, self.node_table, depth=4)
+        node_table.set_root(root)
+        if puct is not None:
+            puct.evaluate([(root, board, child_index)])
+        if alphabeta is None:
+            MctsPlayer.minimax(root, node_table, depth=4, deadline=deadline)
+        else:
+            results = alphabeta.solve_children(board, turn, solver_depth, deadline)
+            for child in children:
+                result = results[child.get_action()]
+                if result == 1:
+                    child.set_minimax_value(turn, solver_depth)
+                elif result == -1:
+                    child.set_minimax_value((turn + 1) % 2, solver_depth)
         root.set_parent(None)
+        return root
+
+    @staticmethod
+    def search(
+        root: MctsNode,
+        node_table: TranspositionTable,
+        simulations=300,
+        leaf_batch=1,
+        executor=None,
+        deadline=None,
+        node_budget=None,
+        puct: "Puct" = None,
+    ) -> int:
+        """Runs simulations from root until one of the budgets is used up: the number
+        of simulations, the time.perf_counter() deadline or the number of new nodes in
+        node_table (None means no limit). Returns the number of simulations done."""
+        nodes = node_table.misses
+        done = 0
+        while simulations is None or done < simulations:
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            if node_budget is not None and node_table.misses - nodes >= node_budget:
+                break
+            batch_size = leaf_batch
+            if simulations is not None:
+                batch_size = min(leaf_batch, simulations - done)
+            MctsPlayer.simulation(
+                root, node_table, batch_size=batch_size, executor=executor, puct=puct
+            )
+            done += batch_size
+        return done
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            initargs = ()
+            if self.puct is not None and self.parallel == "root":
+                # the policy is sent once to each worker (see _init_worker)
+                from puct import policy_to_bytes
+
+                initargs = (
+                    policy_to_bytes(self.puct.policy),
+                    self.puct.c_puct,
+                    self.puct.rollouts,
+                )
+            self.executor = ProcessPoolExecutor(
+                self.workers, initializer=_init_worker, initargs=initargs
+            )
+        return self.executor
+
+    def close(self):
+        """Shuts down the worker processes, if any"""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def root_parallel_search(self, board: np.ndarray, turn: int, deadline=None):
+        """Each worker grows its own tree from board, the statistics of the
+        root children are summed and the most visited action is returned,
+        together with the total number of simulations."""
+        executor = self.get_executor()
+        time_budget = None if deadline is None else deadline - time.perf_counter()
+        options = {
+            "simulations": self.simulations,
+            "leaf_batch": self.leaf_batch,
+            "time_budget": time_budget,
+            "node_budget": self.node_budget,
+            "max_nodes": self.node_table.max_entries,
+            "eviction": self.node_table.eviction,
+            "symmetry": self.node_table.symmetry,
+            "zobrist": self.node_table.zobrist,
+            "reuse_table": self.reuse_table,
+            "solver": self.solver,
+            "solver_depth": self.solver_depth,
+        }
+        futures = [
+            executor.submit(
+                _root_parallel_search, board, turn, random.getrandbits(32), **options
+            )
+            for _ in range(self.workers)
+        ]
+        simulations, done = {}, 0
+        for future in futures:
+            stats, worker_done = future.result()
+            done += worker_done
+            for action, (sims, _) in stats.items():
+                simulations[action] = simulations.get(action, 0) + sims
+        return max(simulations, key=simulations.get), done
+
+    def make_move(self, game: Game) -> tuple[tuple[int, int], Move]:
+        start = time.perf_counter()
+        deadline, minimax_deadline = None, None
+        if self.time_budget is not None:
+            # the minimax at the root can use at most half of the budget
+            deadline = start + self.time_budget
+            minimax_deadline = start + self.time_budget / 2
+        board = game.get_board()
+        turn = game.get_current_player()
+        if _new_game(board, self.pieces) and not self.reuse_table:
+            self.node_table.clear()
+        self.pieces = np.count_nonzero(board != -1)
+        if self.book is not None:
+            action = self.book.lookup(board, turn)
+            if action is not None:
+                self.move_stats.append(
+                    {"simulations": 0, "time": time.perf_counter() - start}
+                )
+                if self.print_board:
+                    print(board)
+                    print(f"Mcts Player going for {action[0]}, {action[1]} (book).")
+                return action
+        root = MctsPlayer.visit_root(
+            board,
+            turn,
+            self.node_table,
+            minimax_deadline,
+            self.alphabeta,
+            self.solver_depth,
+            self.puct,
+        )
+        children = root.get_children()
 
         cell, side = None, None
         for child in children:
@@ -160,13 +474,33 @@ class MctsPlayer(Player):
                 cell, side = child.get_action()
                 break
 
+        done = 0
         if cell is None:
-            for _ in range(300):
-                MctsPlayer.simulation(root, self.node_table)
+            if self.workers > 1 and self.parallel == "root":
+                (cell, side), done = self.root_parallel_search(board, turn, deadline)
+            else:
+                leaf_batch, executor = self.leaf_batch, None
+                if self.workers > 1:
+                    leaf_batch = max(leaf_batch, self.workers)
+                    executor = self.get_executor()
+                done = MctsPlayer.search(
+                    root,
+                    self.node_table,
+                    self.simulations,
+                    leaf_batch,
+                    executor,
+                    deadline,
+                    self.node_budget,
+                    self.puct,
+                )
 
-            cell, side = max(
-                root.get_children(), key=lambda c: c.get_simulations()
-            ).get_action()
+                cell, side = max(
+                    root.get_children(), key=lambda c: c.get_simulations()
+                ).get_action()
+        self.playouts += done
+        self.move_stats.append(
+            {"simulations": done, "time": time.perf_counter() - start}
+        )
 
         if self.print_board:
             print(board)
@@ -174,6 +508,95 @@ class MctsPlayer(Player):
         return cell, side
 
 
+def _new_game(board: np.ndarray, pieces: int) -> bool:
+    """Pieces are never removed from the board, so if there are less pieces
+    than at the previous move, a new game has started."""
+    return np.count_nonzero(board != -1) < pieces
+
+
+def _init_worker(policy: bytes = None, c_puct=1.5, policy_rollouts=False):
+    """Seeds the worker and, with a policy (see puct.policy_to_bytes), builds the
+    Puct of its searches"""
+    global _worker_puct
+    # forked workers inherit the state of the random generators
+    random.seed()
+    np.random.seed()
+    if policy is not None:
+        from puct import Puct, policy_from_bytes
+
+        _worker_puct = Puct(policy_from_bytes(policy), c_puct, policy_rollouts)
+
+
+# node table of a worker process, kept between moves, and pieces on the board
+# at its previous search
+_worker_node_table: TranspositionTable = None
+_worker_pieces = 0
+# alpha-beta searcher of a worker process, if the solver is alphabeta
+_worker_alphabeta: AlphaBeta = None
+# PUCT selection of a worker process, if the player has a policy
+_worker_puct: "Puct" = None
+
+
+def _root_parallel_search(
+    board,
+    turn,
+    seed,
+    simulations,
+    leaf_batch,
+    time_budget,
+    node_budget,
+    max_nodes,
+    eviction,
+    reuse_table,
+    symmetry,
+    zobrist,
+    solver,
+    solver_depth,
+):
+    """Runs in a worker process: grows the worker's own tree from board and
+    returns the statistics (simulations, wins) of the root children by action,
+    and the number of simulations done."""
+    global _worker_node_table, _worker_pieces, _worker_alphabeta
+    start = time.perf_counter()
+    deadline, minimax_deadline = None, None
+    if time_budget is not None:
+        deadline = start + time_budget
+        minimax_deadline = start + time_budget / 2
+    random.seed(seed)
+    np.random.seed(seed)
+    if _worker_node_table is None:
+        _worker_node_table = TranspositionTable(max_nodes, eviction, symmetry, zobrist)
+    if _new_game(board, _worker_pieces) and not reuse_table:
+        _worker_node_table.clear()
+    _worker_pieces = np.count_nonzero(board != -1)
+    if solver == "alphabeta" and _worker_alphabeta is None:
+        _worker_alphabeta = AlphaBeta()
+    root = MctsPlayer.visit_root(
+        board,
+        turn,
+        _worker_node_table,
+        minimax_deadline,
+        _worker_alphabeta if solver == "alphabeta" else None,
+        solver_depth,
+        _worker_puct,
+    )
+    done = MctsPlayer.search(
+        root,
+        _worker_node_table,
+        simulations,
+        leaf_batch,
+        None,
+        deadline,
+        node_budget,
+        _worker_puct,
+    )
+    stats = {
+        child.get_action(): (child.get_simulations(), child.get_wins())
+        for child in root.get_children()
+    }
+    return stats, done
+
+
 class RandomPlayer(Player):
     def __init__(self, print_board=None) -> None:
         super().__init__()
@@ -181,7 +604,7 @@ class RandomPlayer(Player):
 
     def make_move(self, game: "Game") -> tuple[tuple[int, int], Move]:
         board = game.get_board()
-        _, actions = utils.get_possible_actions(board, game.get_current_player())
+        actions = utils.get_legal_actions(board, game.get_current_player())
         cell, side = random.choice(actions)
         if self.print_board:
             print(board)
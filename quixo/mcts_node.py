@@ -1,9 +1,28 @@
 import numpy as np
+from bitboard import BitBoard, encode
 
 
 class MctsNode:
+    # no __dict__: there can be hundreds of thousands of nodes
+    __slots__ = (
+        "board",
+        "turn",
+        "parent",
+        "action",
+        "visited",
+        "children",
+        "parents",
+        "minimax_evaluated",
+        "minimax_value",
+        "simulations",
+        "wins",
+        "priors",
+    )
+
     def __init__(self, board: np.ndarray, player_id):
-        self.board: tuple = tuple(board.ravel())
+        """board can be a NumPy board or a BitBoard, it is stored as an integer
+        (see BitBoard.encode)"""
+        self.board: int = encode(board)
         self.turn: int = player_id
         # parent in the *current* simulation
         self.parent: "MctsNode" = None
@@ -12,7 +31,11 @@ class MctsNode:
         # whether the nodes has been visited (ie a simulation has started from it),
         # this includes expanding the children
         self.visited: bool = False
-        self.children: list = []
+        # an empty tuple until the node is visited, to save a list per node
+        self.children: list = ()
+        # number of visited nodes that have this node among their children (the
+        # node table only evicts a node that none refers to)
+        self.parents: int = 0
         # minimax evaluation: depth and value
         self.minimax_evaluated: int = -1
         self.minimax_value: int = -1
@@ -20,15 +43,20 @@ class MctsNode:
         self.simulations: int = 0
         # winning simulations that have started out from this node
         self.wins: int = 0
+        # prior probabilities of the children, for the PUCT selection (see puct.py)
+        self.priors = None
 
     def __hash__(self):
-        return hash((self.state, self.turn))
+        return hash((self.board, self.turn))
 
     def __eq__(self, other: "MctsNode"):
         return self.board == other.board and self.turn == other.turn
 
-    def get_board(self):
-        return np.array(self.board, dtype=int).reshape(5, 5)
+    def get_board(self) -> np.ndarray:
+        return BitBoard.decode(self.board).to_array()
+
+    def get_bitboard(self) -> BitBoard:
+        return BitBoard.decode(self.board)
 
     def get_turn(self):
         return self.turn
@@ -46,8 +74,24 @@ class MctsNode:
         self.action = action
 
     def set_visited(self, children: list["MctsNode"]):
+        for child in self.children:
+            child.parents -= 1
+        for child in children:
+            child.parents += 1
         self.children = children
         self.visited = True
+        self.priors = None
+
+    def forget_children(self):
+        """The node will have to be visited again; the children no longer refer to
+        it as their parent"""
+        for child in self.children:
+            child.parents -= 1
+            if child.parent is self:
+                child.parent = None
+        self.children = ()
+        self.visited = False
+        self.priors = None
 
     def set_minimax_value(self, minimax_value, depth):
         self.minimax_evaluated = depth
@@ -57,7 +101,13 @@ class MctsNode:
         return self.visited
 
     def get_children(self) -> list["MctsNode"]:
-        return self.children.copy()
+        return list(self.children)
+
+    def get_priors(self):
+        return self.priors
+
+    def set_priors(self, priors):
+        self.priors = priors
 
     def get_number_of_children(self):
         return len(self.children)
@@ -0,0 +1,176 @@
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from bitboard import BitBoard
+from symmetry import canonicalize, restore_action
+import utils
+
+# An opening book is a hash table with open addressing (linear probing), saved as
+# a .npy file and read through a memory map, so that the processes using the same
+# book share its pages. The positions are stored as seen by the player to move
+# (the pieces are swapped if it is player 1: the rules do not depend on the
+# color) and in their canonical orientation (see symmetry.canonicalize), so the
+# key of a position is its canonical encoding, plus one (0 marks an empty slot).
+# The action is the index in utils.ACTIONS of the best action on the canonical
+# board, and value the win rate (in percent, -100 to 100) of the player to move
+# after it.
+BOOK_DTYPE = np.dtype([("key", "<u8"), ("action", "u1"), ("value", "i1")])
+
+_GOLDEN = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+def _slot(key: int, log_size: int) -> int:
+    # Fibonacci hashing: the high bits of the key times 2^64 / golden ratio
+    return (key * _GOLDEN & _MASK64) >> (64 - log_size) if log_size > 0 else 0
+
+
+def position_key(board, turn: int) -> tuple[int, int]:
+    """The key of the position in a book and the symmetry that maps board to
+    the canonical board (to restore the actions of the book)"""
+    if not isinstance(board, BitBoard):
+        board = BitBoard.from_array(board)
+    if turn == 1:
+        board = BitBoard((board.bits[1], board.bits[0]))
+    key, t = canonicalize(board)
+    return key + 1, t
+
+
+class OpeningBook:
+    """Best actions for the first plies of the game, see build_book"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.table = np.load(path, mmap_mode="r")
+        assert self.table.dtype == BOOK_DTYPE
+        self.log_size = len(self.table).bit_length() - 1
+        self.keys = self.table["key"]
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self.keys))
+
+    def find(self, key: int) -> int:
+        """The slot of key, or -1 if it is not in the book"""
+        mask = len(self.keys) - 1
+        slot = _slot(key, self.log_size)
+        while True:
+            stored = int(self.keys[slot])
+            if stored == key:
+                return slot
+            if stored == 0:
+                return -1
+            slot = slot + 1 & mask
+
+    def lookup(self, board, turn: int):
+        """The action of the book for turn on board (a NumPy board or a BitBoard),
+        oriented as board, or None if the position is not in the book"""
+        key, t = position_key(board, turn)
+        slot = self.find(key)
+        if slot == -1:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return restore_action(utils.ACTIONS[self.table[slot]["action"]], t)
+
+    def value(self, board, turn: int):
+        """The value of the book for the position, or None"""
+        slot = self.find(position_key(board, turn)[0])
+        return None if slot == -1 else int(self.table[slot]["value"])
+
+    @staticmethod
+    def write(path: str, entries: dict[int, tuple[int, int]]):
+        """Saves the entries {key: (action, value)} as a book; the table is at most
+        half full, so that a lookup probes few slots"""
+        log_size = max(2 * len(entries) - 1, 1).bit_length()
+        table = np.zeros(1 << log_size, dtype=BOOK_DTYPE)
+        mask = len(table) - 1
+        for key, (action, value) in entries.items():
+            slot = _slot(key, log_size)
+            while table[slot]["key"] != 0:
+                slot = slot + 1 & mask
+            table[slot] = (key, action, value)
+        np.save(path, table)
+
+
+def book_positions(plies: int) -> list[int]:
+    """The keys of the positions (not won) reached in less than plies plies from
+    the empty board, whoever starts"""
+    positions = [position_key(BitBoard(), 0)[0]]
+    level = list(positions)
+    seen = set(positions)
+    for _ in range(plies - 1):
+        next_level = []
+        for key in level:
+            board = BitBoard.decode(key - 1)
+            for child in utils.get_possible_actions(board, 0)[0]:
+                if child.check_win() != -1:
+                    continue
+                child_key = position_key(child, 1)[0]
+                if child_key not in seen:
+                    seen.add(child_key)
+                    next_level.append(child_key)
+        positions += next_level
+        level = next_level
+    return positions
+
+
+def search_position(key: int, simulations: int, solver_depth: int) -> tuple[int, int]:
+    """Searches the position of the book key with a MctsPlayer (with the alpha-beta
+    solver). Returns the best action, as index in utils.ACTIONS, and its value"""
+    from mcts import MctsPlayer
+
+    board = BitBoard.decode(key - 1).to_array()
+    player = MctsPlayer(simulations=simulations, solver="alphabeta", solver_depth=solver_depth)
+    root = MctsPlayer.visit_root(
+        board, 0, player.node_table, None, player.alphabeta, solver_depth
+    )
+    children = root.get_children()
+    for child in children:
+        if child.get_minimax_value() == 0:
+            return utils.ACTION_INDEX[child.get_action()], 100
+    MctsPlayer.search(root, player.node_table, simulations)
+    best = max(children, key=lambda c: c.get_simulations())
+    value = round(100 * best.get_wins() / max(best.get_simulations(), 1))
+    return utils.ACTION_INDEX[best.get_action()], value
+
+
+def _search_chunk(keys, simulations, solver_depth):
+    return [search_position(key, simulations, solver_depth) for key in keys]
+
+
+def build_book(path: str, plies=3, simulations=2000, solver_depth=4, workers=1):
+    """Searches every position of the first plies plies (see book_positions) and
+    saves the book to path"""
+    keys = book_positions(plies)
+    print(f"Searching {len(keys)} positions...")
+    start = time.perf_counter()
+    if workers > 1:
+        chunks = [keys[i::workers] for i in range(workers)]
+        with ProcessPoolExecutor(workers) as executor:
+            results = executor.map(
+                _search_chunk, chunks, [simulations] * workers, [solver_depth] * workers
+            )
+            entries = {}
+            for chunk, chunk_results in zip(chunks, results):
+                entries.update(zip(chunk, chunk_results))
+    else:
+        entries = dict(zip(keys, _search_chunk(keys, simulations, solver_depth)))
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+    OpeningBook.write(path, entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", type=str, default="opening_book.npy")
+    parser.add_argument("--plies", type=int, default=3, help="plies covered by the book")
+    parser.add_argument("--simulations", type=int, default=2000, help="per position")
+    parser.add_argument("--solver_depth", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    build_book(args.output, args.plies, args.simulations, args.solver_depth, args.workers)
+    book = OpeningBook(args.output)
+    print(f"{len(book)} positions in {args.output} ({book.table.nbytes} bytes)")
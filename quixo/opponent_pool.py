@@ -0,0 +1,147 @@
+import os
+import random
+from collections import OrderedDict
+import torch
+from agent import NeuralPlayer, Policy, load_policy
+from game import Player
+
+
+class _Snapshot:
+    """A frozen policy: its parameters in memory, or the file they are saved to,
+    and the results of the games against the training player"""
+
+    __slots__ = ("state", "path", "games", "wins")
+
+    def __init__(self, state: dict = None, path: str = None):
+        self.state = state
+        self.path = path
+        self.games = 0
+        # games won by the snapshot
+        self.wins = 0
+
+
+class OpponentPool:
+    """Opponents for self-play training: fixed players (like a RandomPlayer) and
+    frozen snapshots of the training policy. A snapshot only stores the parameters
+    of the policy (no optimizer, no autograd state), in memory (shared=True moves
+    them to shared memory, for worker processes) or in a file of `folder`; at most
+    max_snapshots snapshots are kept (the oldest are dropped, None means no limit).
+    The NeuralPlayer of a snapshot is built when it is sampled, and at most max_loaded
+    of them are kept, the least recently used are dropped.
+    Sampling (see sample):
+    - "uniform": every opponent with the same probability;
+    - "recent": the fixed players and the `window` most recent snapshots;
+    - "winrate": each opponent with weight p^2, where p is its estimated win rate
+      against the training player, so that the hardest opponents are played most."""
+
+    def __init__(
+        self,
+        fixed: list[Player] = (),
+        sampling="uniform",
+        window=10,
+        max_loaded=8,
+        max_snapshots=None,
+        folder: str = None,
+        shared=False,
+    ):
+        assert sampling in {"uniform", "recent", "winrate"}
+        self.fixed = list(fixed)
+        self.sampling = sampling
+        self.window = window
+        self.max_loaded = max_loaded
+        self.max_snapshots = max_snapshots
+        self.folder = folder
+        self.shared = shared
+        self.snapshots: list[_Snapshot] = []
+        # results of the fixed players, same as the snapshots
+        self.fixed_stats = [_Snapshot() for _ in self.fixed]
+        self.loaded: OrderedDict = OrderedDict()
+        # snapshots taken so far, to name the files
+        self.count = 0
+        if folder is not None:
+            os.makedirs(folder, exist_ok=True)
+
+    def __len__(self):
+        return len(self.fixed) + len(self.snapshots)
+
+    def add_snapshot(self, policy: Policy):
+        state = {k: v.detach().clone() for k, v in policy.state_dict().items()}
+        self.count += 1
+        if self.folder is not None:
+            path = os.path.join(self.folder, f"opponent_{self.count}.mdl")
+            torch.save(state, path)
+            snapshot = _Snapshot(path=path)
+        else:
+            if self.shared:
+                for tensor in state.values():
+                    tensor.share_memory_()
+            snapshot = _Snapshot(state=state)
+        self.snapshots.append(snapshot)
+        self._trim()
+
+    def add_file(self, path: str):
+        """A checkpoint (or a TorchScript export), loaded when it is first sampled;
+        the files must be added from the oldest"""
+        self.snapshots.append(_Snapshot(path=path))
+        self._trim()
+
+    def _trim(self):
+        """Drops the oldest snapshots beyond max_snapshots"""
+        while self.max_snapshots is not None and len(self.snapshots) > self.max_snapshots:
+            dropped = self.snapshots.pop(0)
+            self.loaded.pop(id(dropped), None)
+            # the files of the pool are removed, the added ones are not
+            if dropped.path is not None and os.path.dirname(dropped.path) == self.folder:
+                os.remove(dropped.path)
+
+    def entries(self) -> list[_Snapshot]:
+        """The results of each opponent: the fixed players, then the snapshots"""
+        return self.fixed_stats + self.snapshots
+
+    def candidates(self) -> list[int]:
+        """Indices in entries of the opponents that can be sampled"""
+        n = len(self)
+        if self.sampling == "recent":
+            return list(range(len(self.fixed))) + list(
+                range(max(len(self.fixed), n - self.window), n)
+            )
+        return list(range(n))
+
+    def sample(self) -> tuple[_Snapshot, Player]:
+        """Returns an opponent, with the entry to pass to record with its result"""
+        entries = self.entries()
+        candidates = self.candidates()
+        if self.sampling == "winrate":
+            weights = [
+                ((entries[i].wins + 1) / (entries[i].games + 2)) ** 2 for i in candidates
+            ]
+            index = random.choices(candidates, weights)[0]
+        else:
+            index = random.choice(candidates)
+        if index < len(self.fixed):
+            return entries[index], self.fixed[index]
+        return entries[index], self.get(entries[index])
+
+    def get(self, snapshot: _Snapshot) -> NeuralPlayer:
+        key = id(snapshot)
+        if key in self.loaded:
+            self.loaded.move_to_end(key)
+            return self.loaded[key]
+        if snapshot.state is not None:
+            # the parameters of the policy are the tensors of the snapshot, not a copy
+            policy = Policy()
+            policy.load_state_dict(snapshot.state, assign=True)
+        else:
+            policy = load_policy(snapshot.path)
+        for parameter in policy.parameters():
+            parameter.requires_grad_(False)
+        player = NeuralPlayer(policy, train=False)
+        self.loaded[key] = player
+        if len(self.loaded) > self.max_loaded:
+            self.loaded.popitem(last=False)
+        return player
+
+    def record(self, entry: _Snapshot, reward: int):
+        """reward is the one of the training player: 1 if it won, -1 if it lost"""
+        entry.games += 1
+        entry.wins += reward < 0
@@ -0,0 +1,122 @@
+import io
+import math
+import numpy as np
+import torch
+from agent import legal_mask, load_policy
+from bitboard import BitBoard, batch_bits
+from mcts_node import MctsNode
+from rollout import batch_check_winner
+import utils
+
+
+def policy_inputs(boards: list[BitBoard], turns) -> np.ndarray:
+    """The boards (N, 25) as seen by the player to move: the Policy was trained as
+    player 0, so the pieces are swapped on the boards where player 1 moves"""
+    arrays = np.stack([board.to_array().ravel() for board in boards])
+    swap = np.asarray(turns) == 1
+    arrays[swap] = np.where(arrays[swap] == -1, -1, 1 - arrays[swap])
+    return arrays
+
+
+def action_priors(policy: torch.nn.Module, boards: np.ndarray) -> np.ndarray:
+    """Probabilities (N, len(utils.ACTIONS)) of the legal actions of player 0 on
+    the boards (N, 25), see policy_inputs"""
+    with torch.inference_mode():
+        side, cell = policy(torch.tensor(boards, dtype=torch.float32))
+        probs = (side[:, :, None] @ cell[:, None, :] + 1e-8) * legal_mask(boards, 0)
+        priors = probs[:, utils.ACTION_SIDES, utils.ACTION_POLICY_CELLS].numpy()
+    return priors / priors.sum(axis=1, keepdims=True)
+
+
+def policy_to_bytes(policy: torch.nn.Module) -> bytes:
+    """The policy saved as TorchScript (if it is) or as the state dict of a Policy,
+    to be sent to other processes (a TorchScript module cannot be pickled), see
+    policy_from_bytes"""
+    buffer = io.BytesIO()
+    if isinstance(policy, torch.jit.ScriptModule):
+        torch.jit.save(policy, buffer)
+    else:
+        torch.save(policy.state_dict(), buffer)
+    return buffer.getvalue()
+
+
+def policy_from_bytes(data: bytes) -> torch.nn.Module:
+    return load_policy(io.BytesIO(data))
+
+
+class Puct:
+    """PUCT selection for MctsPlayer: the child maximizing
+    Q + c_puct * P * sqrt(N) / (1 + n), where Q is the win rate of the child
+    (wins minus losses over simulations, 0 if it has none), n its simulations, N the
+    simulations of the parent and P its prior, given by the Policy (the probabilities
+    of the actions leading to a child are summed). The priors of the nodes expanded
+    by a batch of simulations are computed with one forward pass; until then, they
+    are uniform. With rollouts=True, the rollouts are played by the Policy instead
+    of random moves."""
+
+    def __init__(self, policy: torch.nn.Module, c_puct=1.5, rollouts=False):
+        self.policy = policy
+        self.c_puct = c_puct
+        self.rollouts = rollouts
+
+    def select(self, node: MctsNode, player: int) -> MctsNode:
+        children = node.get_children()
+        priors = node.get_priors()
+        if priors is None:
+            priors = [1 / len(children)] * len(children)
+        # inform MCTS: discard children that surely lead to losing (as in selection)
+        candidates = [
+            i for i, c in enumerate(children) if c.get_minimax_value() != (player + 1) % 2
+        ]
+        if len(candidates) == 0:
+            candidates = range(len(children))
+        scale = self.c_puct * math.sqrt(max(node.get_simulations(), 1))
+
+        def score(i):
+            child = children[i]
+            n = child.get_simulations()
+            q = child.get_wins() / n if n > 0 else 0.0
+            return q + scale * priors[i] / (1 + n)
+
+        return children[max(candidates, key=score)]
+
+    def evaluate(self, expansions: list[tuple[MctsNode, BitBoard, list[int]]]):
+        """Sets the priors of the expanded nodes, given with the board they were
+        expanded from and the index of the child reached by each legal action (in
+        the order of utils.get_legal_actions)"""
+        if len(expansions) == 0:
+            return
+        boards = [board for _, board, _ in expansions]
+        turns = [node.get_turn() for node, _, _ in expansions]
+        action_p = action_priors(self.policy, policy_inputs(boards, turns))
+        for (node, board, child_index), turn, p in zip(expansions, turns, action_p):
+            legal = np.flatnonzero(utils.get_legal_mask(board, turn))
+            priors = np.bincount(
+                child_index, weights=p[legal], minlength=node.get_number_of_children()
+            )
+            node.set_priors(priors)
+
+    def rollout(self, boards: list[BitBoard], turns) -> np.ndarray:
+        """Like rollout.batch_rollout (same conventions), with the moves sampled
+        from the Policy, one forward pass per ply for all the games"""
+        arrays = np.stack([board.to_array().ravel() for board in boards])
+        player = np.array(turns, dtype=np.int64)
+        winners = np.full(len(arrays), -1)
+        live = np.arange(len(arrays))
+        while len(live) > 0:
+            player[live] = 1 - player[live]
+            p = player[live]
+            inputs = arrays[live]
+            swap = p == 1
+            inputs[swap] = np.where(inputs[swap] == -1, -1, 1 - inputs[swap])
+            priors = action_priors(self.policy, inputs)
+            # sampling by inverse transform, one uniform number per game
+            cumulative = priors.cumsum(axis=1)
+            u = np.random.random((len(live), 1)) * cumulative[:, -1:]
+            actions = np.minimum((cumulative < u).sum(axis=1), len(utils.ACTIONS) - 1)
+            arrays[live] = utils.get_new_boards(arrays[live], p, actions)
+            winner = batch_check_winner(batch_bits(arrays[live]), p)
+            over = winner > -1
+            winners[live[over]] = winner[over]
+            live = live[~over]
+        return winners
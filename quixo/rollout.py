@@ -0,0 +1,114 @@
+import random
+import numpy as np
+from bitboard import BitBoard, GAME_LINE_GROUPS, check_winner, has_line, update_counts
+import utils
+
+# for each action in utils.ACTIONS: the bit of the taken piece and the slide masks
+_MOVES = utils.ACTION_SLIDES
+_GATHERS = utils.ACTION_GATHERS
+
+
+def random_rollout(board, turn: int) -> int:
+    """Plays uniformly random legal moves until the game ends and returns the winner.
+    This is equivalent to Game.play with two RandomPlayer, with the same conventions
+    of MctsPlayer.rollout: turn is the game's current_player_idx, so the first move is
+    made by (turn + 1) % 2. The board (NumPy or BitBoard) is not changed."""
+    if not isinstance(board, BitBoard):
+        board = BitBoard.from_array(board)
+    bits = list(board.bits)
+    # the line counts are updated incrementally, a complete line is found in O(1)
+    counts = list(board.line_counts())
+    player = turn
+    n = len(_MOVES)
+    rand = random.random
+    while True:
+        player = 1 - player
+        own, other = bits[player], bits[1 - player]
+        # rejection sampling is uniform over the legal actions
+        a = int(rand() * n)
+        while other & _MOVES[a][0]:
+            a = int(rand() * n)
+        _, keep, shifted, up, down, dest = _MOVES[a]
+        new_own = (own & keep) | (((own & shifted) << up) >> down) | dest
+        new_other = (other & keep) | (((other & shifted) << up) >> down)
+        gather = _GATHERS[a]
+        counts[player] = update_counts(counts[player], own, new_own, gather)
+        counts[1 - player] = update_counts(counts[1 - player], other, new_other, gather)
+        bits[player], bits[1 - player] = new_own, new_other
+        win0, win1 = has_line(counts[0]), has_line(counts[1])
+        if win0 and win1:
+            return check_winner(bits[0], bits[1], player)
+        if win0 or win1:
+            return 0 if win0 else 1
+
+
+# the same tables as NumPy arrays, for batch_rollout
+_CELLS, _KEEP, _SHIFTED, _UP, _DOWN, _DEST = np.array(_MOVES, dtype=np.int64).T
+_LINES = np.array([line for group in GAME_LINE_GROUPS for line in group], dtype=np.int64)
+
+
+def batch_check_winner(bits: np.ndarray, current_player: np.ndarray) -> np.ndarray:
+    """Vectorized bitboard.check_winner: bits has shape (N, 2), one row per board"""
+    win = ((bits[:, :, None] & _LINES) == _LINES).any(axis=2)
+    result = np.where(win[:, 0], 0, win[:, 1] * 2 - 1)
+    both = win[:, 0] & win[:, 1]
+    if both.any():
+        # the order of the lines decides, as in check_winner
+        current_player = np.broadcast_to(current_player, len(bits))
+        for i in np.flatnonzero(both):
+            result[i] = check_winner(int(bits[i, 0]), int(bits[i, 1]), int(current_player[i]))
+    return result
+
+
+# batch_rollout plays one by one the games that are left when there are less than
+# this: a vectorized step costs about as much for a few games as for many (see the
+# crossover of bench_engine.py)
+BATCH_ROLLOUT_TAIL = 16
+
+
+def _has_line(bits: np.ndarray) -> np.ndarray:
+    return ((bits[:, None] & _LINES) == _LINES).any(axis=1)
+
+
+def batch_rollout(boards: list, turns) -> np.ndarray:
+    """Plays one random rollout for each board, advancing all the games in lockstep
+    with vectorized operations, and returns the winners. Each game follows the
+    conventions of random_rollout, which plays the last games (less than
+    BATCH_ROLLOUT_TAIL), so that a small batch costs no more than rolling out each
+    board."""
+    bits = np.array(
+        [(b if isinstance(b, BitBoard) else BitBoard.from_array(b)).bits for b in boards],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    winners = np.full(len(bits), -1)
+    # the games that are not over: their indices, the player to move, the pieces of
+    # the player to move and the ones of the other player
+    live = np.arange(len(bits))
+    player = 1 - np.asarray(turns, dtype=np.int64).reshape(len(bits))
+    own, other = bits[live, player], bits[live, 1 - player]
+    while len(live) >= BATCH_ROLLOUT_TAIL:
+        # uniform choice among the legal actions: the legal action with the largest random key
+        keys = np.random.random((len(live), len(_MOVES)))
+        keys[other[:, None] & _CELLS != 0] = -1
+        a = keys.argmax(axis=1)
+        keep, shifted, up, down = _KEEP[a], _SHIFTED[a], _UP[a], _DOWN[a]
+        own = (own & keep) | (((own & shifted) << up) >> down) | _DEST[a]
+        other = (other & keep) | (((other & shifted) << up) >> down)
+        win_own, win_other = _has_line(own), _has_line(other)
+        over = win_own | win_other
+        if over.any():
+            winner = np.where(win_other, 1 - player, player)
+            for i in np.flatnonzero(win_own & win_other):
+                # the order of the lines decides, as in check_winner
+                bits0, bits1 = (own[i], other[i]) if player[i] == 0 else (other[i], own[i])
+                winner[i] = check_winner(int(bits0), int(bits1), int(player[i]))
+            winners[live[over]] = winner[over]
+            go_on = ~over
+            live, player, own, other = live[go_on], player[go_on], own[go_on], other[go_on]
+        # the other player moves
+        player = 1 - player
+        own, other = other, own
+    for i, p, own_bits, other_bits in zip(live, player, own, other):
+        pieces = (own_bits, other_bits) if p == 0 else (other_bits, own_bits)
+        winners[i] = random_rollout(BitBoard(tuple(map(int, pieces))), 1 - int(p))
+    return winners
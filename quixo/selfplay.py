@@ -0,0 +1,130 @@
+import numpy as np
+import torch
+from agent import NeuralPlayer
+from opponent_pool import OpponentPool
+from game import Game, Player
+from bitboard import batch_bits
+from rollout import batch_check_winner
+import main
+import mcts
+import utils
+
+
+class SelfPlay:
+    """num_games games between a NeuralPlayer (always player 0) and opponents drawn
+    from an OpponentPool (which gets the result of each game), played in lockstep: at each step every game advances by one move,
+    and the player and each neural opponent choose the moves of all their games with
+    a single batched forward pass. The random players are vectorized too, any
+    other Player is asked for its moves one game at a time.
+    The rules are the ones of Game.play: the first player is chosen at random, an
+    illegal move (which the player may choose while exploring) is rejected and the
+    same player moves again, and the winner is decided by Game.check_winner."""
+
+    def __init__(self, player: NeuralPlayer, opponents: OpponentPool, num_games=32):
+        self.player = player
+        self.opponents = opponents
+        self.num_games = num_games
+        self.boards = np.full((num_games, 25), -1, dtype=np.int16)
+        self.to_move = np.zeros(num_games, dtype=np.int64)
+        self.game_opponents: list[Player] = [None] * num_games
+        # entries of the opponents in the pool, to record the results
+        self.game_entries: list = [None] * num_games
+        # boards seen and actions taken by the player in each game
+        self.states: list[list[np.ndarray]] = [[] for _ in range(num_games)]
+        self.actions: list[list[int]] = [[] for _ in range(num_games)]
+        for g in range(num_games):
+            self.reset(g)
+
+    def reset(self, g: int):
+        self.boards[g] = -1
+        self.to_move[g] = np.random.randint(0, 2)
+        self.game_entries[g], self.game_opponents[g] = self.opponents.sample()
+        self.states[g] = []
+        self.actions[g] = []
+
+    def neural_moves(self, player: NeuralPlayer, games: np.ndarray, my_id: int):
+        """Samples (side * 16 + cell) moves of player for the games"""
+        boards = self.boards[games]
+        with torch.inference_mode():
+            x = torch.tensor(boards, dtype=torch.float32)
+            y_side, y_cell = player.policy.forward(x)
+            action_probs = player.get_batch_allowed_action_probs(
+                y_side, y_cell, boards, my_id
+            )
+            if player.train:
+                action_probs = player.explore(action_probs)
+            moves = torch.multinomial(action_probs.reshape(len(games), 64), 1)
+        return moves.squeeze(1).numpy()
+
+    def random_moves(self, games: np.ndarray, my_id: int) -> np.ndarray:
+        """Uniform legal actions (indices in utils.ACTIONS): a random player retries
+        until its move is legal, so its moves are uniform over the legal ones"""
+        keys = np.random.random((len(games), len(utils.ACTIONS)))
+        keys[~utils.get_legal_masks(self.boards[games], my_id)] = -1
+        return keys.argmax(axis=1)
+
+    def player_moves(self, player: Player, games: np.ndarray, my_id: int) -> np.ndarray:
+        """Legal actions (indices in utils.ACTIONS) of any other Player"""
+        actions = []
+        for g in games:
+            game = Game()
+            game._board = self.boards[g].reshape(5, 5).copy()
+            game.current_player_idx = my_id
+            legal = utils.get_legal_mask(game._board, my_id)
+            action = -1
+            while action == -1 or not legal[action]:
+                cell, side = player.make_move(game)
+                action = utils.ACTION_INDEX.get((tuple(cell), side), -1)
+            actions.append(action)
+        return np.array(actions, dtype=np.int64)
+
+    def step(self) -> list[tuple[np.ndarray, np.ndarray, int]]:
+        """Plays one move in each game. Returns the finished episodes of the player,
+        as (boards, actions, reward) for NeuralPlayer.episodes_finished; the
+        finished games are started again with a new opponent."""
+        actions = np.full(self.num_games, -1)
+        games = np.flatnonzero(self.to_move == 0)
+        if len(games) > 0:
+            moves = self.neural_moves(self.player, games, 0)
+            for g, move in zip(games, moves):
+                self.states[g].append(self.boards[g].copy())
+                self.actions[g].append(move)
+            actions[games] = utils.POLICY_ACTIONS[moves]
+        # the games of each opponent
+        by_opponent: dict[int, list[int]] = {}
+        for g in np.flatnonzero(self.to_move == 1):
+            by_opponent.setdefault(id(self.game_opponents[g]), []).append(g)
+        for games in by_opponent.values():
+            games = np.array(games)
+            opponent = self.game_opponents[games[0]]
+            if isinstance(opponent, NeuralPlayer):
+                actions[games] = utils.POLICY_ACTIONS[self.neural_moves(opponent, games, 1)]
+            elif isinstance(opponent, (main.RandomPlayer, mcts.RandomPlayer)):
+                actions[games] = self.random_moves(games, 1)
+            else:
+                actions[games] = self.player_moves(opponent, games, 1)
+
+        # illegal moves are rejected: the same player moves again
+        legal = actions != -1
+        legal[legal] = utils.get_legal_masks(self.boards[legal], self.to_move[legal])[
+            np.arange(np.count_nonzero(legal)), actions[legal]
+        ]
+        moved = np.flatnonzero(legal)
+        self.boards[moved] = utils.get_new_boards(
+            self.boards[moved], self.to_move[moved], actions[moved]
+        )
+        winners = batch_check_winner(batch_bits(self.boards[moved]), self.to_move[moved])
+
+        episodes = []
+        for g, winner in zip(moved, winners):
+            if winner == -1:
+                self.to_move[g] = 1 - self.to_move[g]
+                continue
+            reward = 1 if winner == 0 else -1
+            self.opponents.record(self.game_entries[g], reward)
+            if len(self.states[g]) > 0:
+                episodes.append(
+                    (np.stack(self.states[g]), np.array(self.actions[g]), reward)
+                )
+            self.reset(g)
+        return episodes
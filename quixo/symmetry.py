@@ -0,0 +1,91 @@
+from game import Move
+from bitboard import BitBoard
+
+# The 8 symmetries of the square, as functions of the cell (x, y).
+# The rules of Quixo do not change if the board is rotated or reflected, as long
+# as the directions of the slides are rotated or reflected as well.
+TRANSFORMS = [
+    lambda x, y: (x, y),
+    lambda x, y: (4 - y, x),
+    lambda x, y: (4 - x, 4 - y),
+    lambda x, y: (y, 4 - x),
+    lambda x, y: (4 - x, y),
+    lambda x, y: (x, 4 - y),
+    lambda x, y: (y, x),
+    lambda x, y: (4 - y, 4 - x),
+]
+# direction in which the taken piece is pushed by each move
+DIRECTIONS = {
+    Move.TOP: (0, -1),
+    Move.BOTTOM: (0, 1),
+    Move.LEFT: (-1, 0),
+    Move.RIGHT: (1, 0),
+}
+INVERSE = [
+    next(u for u in range(8) if all(
+        TRANSFORMS[u](*TRANSFORMS[t](x, y)) == (x, y) for x in range(5) for y in range(5)
+    ))
+    for t in range(8)
+]
+
+
+def _row_tables(transform) -> list[list[int]]:
+    """tables[y][v] are the bits of the transformed board for the row y with bits v"""
+    tables = []
+    for y in range(5):
+        table = []
+        for v in range(32):
+            bits = 0
+            for x in range(5):
+                if v >> x & 1:
+                    x_, y_ = transform(x, y)
+                    bits |= 1 << (y_ * 5 + x_)
+            table.append(bits)
+        tables.append(table)
+    return tables
+
+
+_ROW_TABLES = [_row_tables(transform) for transform in TRANSFORMS]
+
+
+def transform_bits(bits: int, t: int) -> int:
+    """Applies the symmetry t to a 25-bit board"""
+    tables = _ROW_TABLES[t]
+    return (
+        tables[0][bits & 31]
+        | tables[1][bits >> 5 & 31]
+        | tables[2][bits >> 10 & 31]
+        | tables[3][bits >> 15 & 31]
+        | tables[4][bits >> 20 & 31]
+    )
+
+
+def transform_board(board: BitBoard, t: int) -> BitBoard:
+    return BitBoard((transform_bits(board.bits[0], t), transform_bits(board.bits[1], t)))
+
+
+def canonicalize(board: BitBoard) -> tuple[int, int]:
+    """Returns the canonical encoding of the board (the smallest encoding among
+    its 8 symmetries, see BitBoard.encode) and the symmetry that produces it."""
+    bits0, bits1 = board.bits
+    best, best_t = None, 0
+    for t in range(8):
+        key = transform_bits(bits0, t) | transform_bits(bits1, t) << 25
+        if best is None or key < best:
+            best, best_t = key, t
+    return best, best_t
+
+
+def transform_action(action: tuple[tuple[int, int], Move], t: int):
+    """The action that corresponds to action on the board transformed by t"""
+    (x, y), move = action
+    dx, dy = DIRECTIONS[move]
+    x_, y_ = TRANSFORMS[t](x, y)
+    x1, y1 = TRANSFORMS[t](x + dx, y + dy)
+    direction = (x1 - x_, y1 - y_)
+    return (x_, y_), next(m for m, d in DIRECTIONS.items() if d == direction)
+
+
+def restore_action(action: tuple[tuple[int, int], Move], t: int):
+    """Maps an action on the board transformed by t back to the original board"""
+    return transform_action(action, INVERSE[t])
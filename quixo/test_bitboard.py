@@ -0,0 +1,66 @@
+import argparse
+import random
+from game import Game, Move, Player
+from bitboard import BitBoard, line_counts
+from zobrist import zobrist_hash
+import utils
+
+
+class RecordingPlayer(Player):
+    """Plays random (possibly invalid) moves and records every board it sees."""
+
+    def __init__(self, rng: random.Random, history: list) -> None:
+        super().__init__()
+        self.rng = rng
+        self.history = history
+
+    def make_move(self, game: "Game") -> tuple[tuple[int, int], Move]:
+        assert game.get_hash() == zobrist_hash(game.get_board())
+        self.history.append((game.get_board(), game.get_current_player()))
+        from_pos = (self.rng.randint(0, 4), self.rng.randint(0, 4))
+        move = self.rng.choice([Move.TOP, Move.BOTTOM, Move.LEFT, Move.RIGHT])
+        return from_pos, move
+
+
+def play(seed: int, bitboard: bool):
+    rng = random.Random(seed)
+    history = []
+    game = Game(bitboard=bitboard)
+    game.current_player_idx = rng.randint(0, 1)
+    winner = game.play(RecordingPlayer(rng, history), RecordingPlayer(rng, history))
+    history.append((game.get_board(), game.get_current_player()))
+    return winner, history
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    positions = 0
+    for g in range(args.games):
+        winner, history = play(args.seed + g, bitboard=False)
+        bb_winner, bb_history = play(args.seed + g, bitboard=True)
+        assert winner == bb_winner, f"game {g}: winner {winner} != {bb_winner}"
+        assert len(history) == len(bb_history), f"game {g}: different lengths"
+        for (board, turn), (bb_board, bb_turn) in zip(history, bb_history):
+            assert turn == bb_turn and (board == bb_board).all(), f"game {g}"
+            bitboard = BitBoard.from_array(board)
+            assert (bitboard.to_array() == board).all()
+            assert utils.check_win(board, turn) == utils.check_win(bitboard, turn)
+            boards, actions = utils.get_possible_actions(board, turn)
+            bb_boards, bb_actions = utils.get_possible_actions(bitboard, turn)
+            assert actions == bb_actions, f"game {g}: different actions"
+            for action, child, bb_child in zip(actions, boards, bb_boards):
+                assert (child == bb_child.to_array()).all(), f"game {g}"
+                # the line counts are updated incrementally by move
+                assert bb_child.line_counts() == tuple(map(line_counts, bb_child.bits))
+                assert utils.check_win(child, turn) == utils.check_win(bb_child, turn)
+                board_hash = zobrist_hash(board)
+                for b in (board, bitboard):
+                    _, child_hash = utils.get_new_board_and_hash(b, board_hash, turn, action)
+                    assert child_hash == zobrist_hash(child), f"game {g}"
+            positions += 1
+
+    print(f"Bitboard engine (with line counts and Zobrist hashes) matches the array engine on {args.games} games, {positions} positions.")
@@ -1,8 +1,7 @@
 import argparse
-from agent import NeuralPlayer, Policy
+from agent import NeuralPlayer, load_policy
 from game import Game, Player
 from main import RandomPlayer
-import torch
 import numpy as np
 
 parser = argparse.ArgumentParser()
@@ -10,15 +9,19 @@ parser.add_argument("--policy", type=str)
 parser.add_argument("--opponent", type=str, default=None)
 parser.add_argument("--test_episodes", type=int, default=100)
 parser.add_argument("--print_board", action="store_true")
+parser.add_argument("--num_threads", type=int, default=None, help="Torch CPU threads")
 args = parser.parse_args()
 
-policy = Policy()
-policy.load_state_dict(torch.load(args.policy))
-player = NeuralPlayer(policy=policy, train=False, print_board=args.print_board)
+policy = load_policy(args.policy)
+player = NeuralPlayer(
+    policy=policy,
+    train=False,
+    print_board=args.print_board,
+    num_threads=args.num_threads,
+)
 opponent = RandomPlayer()
 if args.opponent is not None:
-    policy = Policy()
-    policy.load_state_dict(torch.load(args.opponent))
+    policy = load_policy(args.opponent)
     opponent = NeuralPlayer(policy=policy, train=False)
 
 wins = 0
@@ -0,0 +1,45 @@
+import argparse
+import os
+import sys
+import tempfile
+import numpy as np
+from mcts import MctsPlayer, RandomPlayer
+from game import Game
+
+# the players without a policy do not load torch
+assert "torch" not in sys.modules
+
+from agent import Policy, export_policy, load_policy
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=2)
+    parser.add_argument("--simulations", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    np.random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as folder:
+        # a TorchScript module cannot be pickled to the workers
+        path = os.path.join(folder, "policy.pt")
+        export_policy(Policy(), path)
+        policies = {"TorchScript": load_policy(path), "Policy": Policy()}
+        for name, policy in policies.items():
+            player = MctsPlayer(
+                simulations=args.simulations,
+                workers=args.workers,
+                parallel="root",
+                policy=policy,
+            )
+            for g in range(args.games):
+                game = Game()
+                game.current_player_idx = g % 2
+                game.play(player, RandomPlayer())
+            searched = [s["simulations"] for s in player.move_stats if s["simulations"] > 0]
+            player.close()
+            # each worker runs all the simulations of a move
+            assert all(s == args.simulations * args.workers for s in searched), name
+            print(f"{name}: {len(player.move_stats)} moves, {player.playouts} simulations")
+
+    print(f"Root parallel PUCT works with {args.workers} workers.")
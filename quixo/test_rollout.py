@@ -0,0 +1,83 @@
+import argparse
+import random
+import numpy as np
+from game import Game
+import mcts
+from mcts import MctsPlayer, RandomPlayer
+from bench_rollout import random_positions
+from rollout import BATCH_ROLLOUT_TAIL, batch_rollout, random_rollout
+import utils
+
+
+def replay(positions, keys: list, seed: int) -> list[int]:
+    """The winners of batch_rollout on the positions, played by Game with the
+    random keys it drew (one row per game not over, at each step) and then by
+    random_rollout from seed"""
+    boards = [board.copy() for board, _ in positions]
+    players = [1 - turn for _, turn in positions]
+    winners = [-1] * len(positions)
+    live = list(range(len(positions)))
+    for step_keys in keys:
+        assert len(step_keys) == len(live)
+        for i, row in zip(live, step_keys):
+            legal = utils.get_legal_actions(boards[i], players[i])
+            action = max(legal, key=lambda a: row[utils.ACTION_INDEX[a]])
+            boards[i] = utils.get_new_board(boards[i], players[i], action)
+            game = Game()
+            game._board = boards[i]
+            game.current_player_idx = players[i]
+            winners[i] = game.check_winner()
+            players[i] = 1 - players[i]
+        live = [i for i in live if winners[i] == -1]
+    assert len(live) < BATCH_ROLLOUT_TAIL
+    random.seed(seed)
+    for i in live:
+        winners[i] = random_rollout(boards[i], 1 - players[i])
+    return winners
+
+
+class CountingBatch:
+    def __init__(self):
+        self.boards = []
+
+    def __call__(self, boards, turns):
+        self.boards.append(len(boards))
+        return batch_rollout(boards, turns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batches", type=int, default=10)
+    parser.add_argument("--size", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # batch_rollout plays the same games as Game, with the keys it draws
+    uniform = np.random.random
+    for b in range(args.batches):
+        positions = random_positions(args.size, 8, random.Random(args.seed + b))
+        keys = []
+
+        def recording(size):
+            keys.append(uniform(size))
+            return keys[-1]
+
+        np.random.random = recording
+        random.seed(args.seed + b)
+        winners = batch_rollout([board for board, _ in positions], [t for _, t in positions])
+        np.random.random = uniform
+        assert list(winners) == replay(positions, keys, args.seed + b), f"batch {b}"
+
+    # MctsPlayer rolls out its leaf batches with batch_rollout
+    counting = CountingBatch()
+    mcts.batch_rollout = counting
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    player = MctsPlayer(simulations=256, leaf_batch=32)
+    Game().play(player, RandomPlayer(), max_plies=20)
+    assert max(counting.boards) >= BATCH_ROLLOUT_TAIL, counting.boards
+
+    print(
+        f"batch_rollout matches Game on {args.batches} batches of {args.size} games; "
+        f"MctsPlayer rolled out {sum(counting.boards)} leaves in {len(counting.boards)} batches."
+    )
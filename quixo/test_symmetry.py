@@ -0,0 +1,38 @@
+import argparse
+from bitboard import BitBoard
+from symmetry import canonicalize, transform_action, restore_action, transform_board
+from test_bitboard import play
+import utils
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    positions = 0
+    for g in range(args.games):
+        _, history = play(args.seed + g, bitboard=True)
+        for board, turn in history:
+            board = BitBoard.from_array(board)
+            key, t = canonicalize(board)
+            assert transform_board(board, t).encode() == key
+            actions = utils.get_legal_actions(board, turn)
+            for s in range(8):
+                symmetric = transform_board(board, s)
+                # symmetric boards have the same canonical form...
+                assert canonicalize(symmetric)[0] == key, f"game {g}"
+                # ...and the same rules, once the actions are transformed
+                assert sorted(utils.get_legal_actions(symmetric, turn), key=str) == sorted(
+                    (transform_action(a, s) for a in actions), key=str
+                ), f"game {g}"
+                for action in actions:
+                    assert restore_action(transform_action(action, s), s) == action
+                    child = utils.get_new_board(board, turn, action)
+                    symmetric_child = utils.get_new_board(
+                        symmetric, turn, transform_action(action, s)
+                    )
+                    assert transform_board(child, s) == symmetric_child, f"game {g}"
+            positions += 1
+
+    print(f"Symmetries are consistent with the rules on {args.games} games, {positions} positions.")
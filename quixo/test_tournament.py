@@ -0,0 +1,26 @@
+import argparse
+from tournament import Sprt, parse_options, play_game, report, run_tournament
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max_plies", type=int, default=60)
+    args = parser.parse_args()
+
+    options = parse_options("simulations=50,weights=(1, 2),solver='alpha,beta'")
+    assert options == {"simulations": 50, "weights": (1, 2), "solver": "alpha,beta"}
+    assert parse_options("") == {}
+
+    # deterministic players may repeat the same moves forever
+    a, b = "alphabeta:max_depth=3", "alphabeta:max_depth=2"
+    result = play_game(a, b, True, 0, max_plies=args.max_plies)
+    assert result["winner"] in {-1, 0, 1}
+
+    pairings = run_tournament(
+        [(a, b)], 2, sprt=Sprt(), verbose=False, max_plies=args.max_plies
+    )
+    pairing = pairings[0]
+    assert pairing.played == 2
+    assert pairing.score() == pairing.wins + pairing.draws / 2
+    report(pairings)
+
+    print(f"The games end within {args.max_plies} plies.")
@@ -0,0 +1,69 @@
+import argparse
+import gc
+import random
+import numpy as np
+from game import Game
+from mcts import MctsPlayer, RandomPlayer
+from mcts_node import MctsNode
+
+
+def check_table(player: MctsPlayer):
+    """The visited nodes of the table refer to nodes of the table, and the parents
+    of each node are the visited nodes that refer to it"""
+    table = player.node_table
+    nodes = {id(node): node for node in table.entries.values()}
+    parents = dict.fromkeys(nodes, 0)
+    holders = list(nodes.values())
+    if id(table.root) not in nodes:
+        holders.append(table.root)
+    for node in holders:
+        for child in node.get_children():
+            assert id(child) in nodes, "a child is not in the table"
+            parents[id(child)] += 1
+    for key, node in nodes.items():
+        assert node.parents == parents[key], "wrong number of parents"
+
+
+class CheckedPlayer(MctsPlayer):
+    """Checks the node table after each move"""
+
+    most_alive = 0
+
+    def make_move(self, game):
+        move = super().make_move(game)
+        check_table(self)
+        gc.collect()
+        alive = sum(isinstance(o, MctsNode) for o in gc.get_objects())
+        self.most_alive = max(self.most_alive, alive)
+        return move
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max_nodes", type=int, default=300)
+    parser.add_argument("--simulations", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    configs = [
+        {"eviction": "lru"},
+        {"eviction": "visits"},
+        {"eviction": "visits", "leaf_batch": 8},
+        {"eviction": "lru", "symmetry": True, "zobrist": True},
+    ]
+    for config in configs:
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+        player = CheckedPlayer(
+            simulations=args.simulations, max_nodes=args.max_nodes, **config
+        )
+        Game().play(player, RandomPlayer(), max_plies=40)
+        # the protected nodes can exceed the cap by about two expansions
+        assert player.most_alive <= args.max_nodes + 100, player.most_alive
+        print(
+            f"{config}: {player.node_table.evictions} evictions, "
+            f"at most {player.most_alive} nodes alive"
+        )
+        del player
+
+    print("The node table holds every node of the tree, within its cap.")
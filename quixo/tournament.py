@@ -0,0 +1,309 @@
+import argparse
+import ast
+import json
+import math
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
+from game import Game, Player
+
+# A player is described by a spec string "name" or "name:key=value,key=value",
+# for example "mcts:simulations=500,solver='alphabeta'" or
+# "neural:policy='policy_training_30000.mdl'". The values are Python literals.
+# Specs (instead of players) are sent to the worker processes, which build each
+# player once and keep it from one game to the next.
+
+
+def _random_player(**kwargs) -> Player:
+    from main import RandomPlayer
+
+    return RandomPlayer(**kwargs)
+
+
+def _legal_random_player(**kwargs) -> Player:
+    from mcts import RandomPlayer
+
+    return RandomPlayer(**kwargs)
+
+
+def _mcts_player(**kwargs) -> Player:
+    from mcts import MctsPlayer
+
+    return MctsPlayer(**kwargs)
+
+
+def _alphabeta_player(**kwargs) -> Player:
+    from alphabeta import AlphaBetaPlayer
+
+    return AlphaBetaPlayer(**kwargs)
+
+
+def _neural_player(policy, **kwargs) -> Player:
+    from agent import NeuralPlayer, load_policy
+
+    return NeuralPlayer(policy=load_policy(policy), train=False, **kwargs)
+
+
+PLAYERS = {
+    "random": _random_player,
+    "legal_random": _legal_random_player,
+    "mcts": _mcts_player,
+    "alphabeta": _alphabeta_player,
+    "neural": _neural_player,
+}
+
+
+def parse_options(options: str) -> dict:
+    """The options "key=value,key=value" of a spec, as keyword arguments (the values
+    may contain commas, as tuples, lists or strings)"""
+    call = ast.parse(f"dict({options})", mode="eval").body
+    if len(call.args) > 0:
+        raise ValueError(f"options must be key=value: {options}")
+    return {k.arg: ast.literal_eval(k.value) for k in call.keywords}
+
+
+def make_player(spec: str) -> Player:
+    name, _, options = spec.partition(":")
+    return PLAYERS[name](**parse_options(options))
+
+
+def round_robin(specs: list[str]) -> list[tuple[str, str]]:
+    return [(a, b) for i, a in enumerate(specs) for b in specs[i + 1 :]]
+
+
+def gauntlet(specs: list[str]) -> list[tuple[str, str]]:
+    """The first player against each of the others"""
+    return [(specs[0], b) for b in specs[1:]]
+
+
+# players of the current process, by spec
+_players: dict[str, Player] = {}
+
+
+def play_game(a: str, b: str, a_starts: bool, seed: int, max_plies: int = None) -> dict:
+    """Plays a game between the players a (player 0) and b (player 1);
+    the first move is made by a if a_starts. After max_plies moves (None means no
+    limit) the game is a draw: its winner is -1 (two deterministic players may
+    repeat the same moves forever)."""
+    random.seed(seed)
+    np.random.seed(seed)
+    for spec in (a, b):
+        if spec not in _players:
+            _players[spec] = make_player(spec)
+    game = Game()
+    # Game.play increments current_player_idx before the first move
+    game.current_player_idx = 1 if a_starts else 0
+    start = time.perf_counter()
+    winner = game.play(_players[a], _players[b], max_plies)
+    return {
+        "a": a,
+        "b": b,
+        "a_starts": a_starts,
+        "seed": seed,
+        "winner": int(winner),
+        "time": time.perf_counter() - start,
+    }
+
+
+def wilson_interval(wins: int, games: int, z=1.96) -> tuple[float, float]:
+    """Confidence interval of a win rate (95% with the default z)"""
+    if games == 0:
+        return 0.0, 1.0
+    p = wins / games
+    center = (p + z * z / (2 * games)) / (1 + z * z / games)
+    half = z * math.sqrt(p * (1 - p) / games + z * z / (4 * games**2)) / (1 + z * z / games)
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+class Sprt:
+    """Sequential probability ratio test of H0: win rate = p0 against
+    H1: win rate = p1, with error probabilities alpha (accepting H1 when H0
+    is true) and beta (accepting H0 when H1 is true). A draw counts as half a
+    win and half a loss."""
+
+    def __init__(self, p0=0.5, p1=0.6, alpha=0.05, beta=0.05):
+        self.win = math.log(p1 / p0)
+        self.loss = math.log((1 - p1) / (1 - p0))
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+
+    def llr(self, wins: float, losses: float) -> float:
+        return wins * self.win + losses * self.loss
+
+    def decision(self, wins: float, losses: float):
+        """"H1", "H0" or None if the test goes on"""
+        llr = self.llr(wins, losses)
+        if llr >= self.upper:
+            return "H1"
+        if llr <= self.lower:
+            return "H0"
+        return None
+
+
+class Pairing:
+    def __init__(self, a: str, b: str, games: int):
+        self.a = a
+        self.b = b
+        self.games = games
+        self.scheduled = 0
+        self.played = 0
+        self.wins = 0
+        self.draws = 0
+        self.decision = None
+
+    def score(self) -> float:
+        """The wins of a, a draw counting as half a win"""
+        return self.wins + self.draws / 2
+
+    def done(self) -> bool:
+        return self.decision is not None or self.played == self.games
+
+
+def run_tournament(
+    pairs: list[tuple[str, str]],
+    games: int,
+    workers=1,
+    output=None,
+    sprt: Sprt = None,
+    seed=0,
+    verbose=True,
+    max_plies=500,
+) -> list[Pairing]:
+    """Plays up to `games` games for each pair, alternating the first player;
+    a game is a draw after max_plies moves (see play_game).
+    Each result is appended to the output file (JSON lines) as soon as it arrives.
+    With an Sprt, a pairing stops as soon as the test accepts one of the hypotheses
+    (on the win rate of the first player of the pair); the games already running
+    are discarded."""
+    pairings = [Pairing(a, b, games) for a, b in pairs]
+    rng = random.Random(seed)
+    out = open(output, "a") if output is not None else None
+
+    def jobs():
+        # interleaves the pairings, so that each of them progresses
+        while True:
+            pending = [p for p in pairings if not p.done() and p.scheduled < p.games]
+            if len(pending) == 0:
+                return
+            for p in pending:
+                if p.done() or p.scheduled == p.games:
+                    continue
+                a_starts = p.scheduled % 2 == 0
+                p.scheduled += 1
+                yield p, (p.a, p.b, a_starts, rng.getrandbits(32), max_plies)
+
+    def record(pairing: Pairing, result: dict):
+        if pairing.done():
+            return
+        pairing.played += 1
+        pairing.wins += result["winner"] == 0
+        pairing.draws += result["winner"] == -1
+        if sprt is not None:
+            score = pairing.score()
+            pairing.decision = sprt.decision(score, pairing.played - score)
+        if out is not None:
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+        if verbose:
+            print(
+                f"{pairing.a} vs {pairing.b}: {pairing.score():g}/{pairing.played}"
+                + (f" ({pairing.decision})" if pairing.decision is not None else ""),
+                flush=True,
+            )
+
+    try:
+        if workers == 1:
+            for pairing, job in jobs():
+                record(pairing, play_game(*job))
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                running = {}
+                queue = jobs()
+                exhausted = False
+                while not exhausted or len(running) > 0:
+                    # a few games per worker are queued, so that the stopped
+                    # pairings waste little work
+                    while not exhausted and len(running) < 2 * workers:
+                        job = next(queue, None)
+                        if job is None:
+                            exhausted = True
+                            break
+                        running[executor.submit(play_game, *job[1])] = job[0]
+                    if len(running) == 0:
+                        break
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        record(running.pop(future), future.result())
+                    for future, pairing in list(running.items()):
+                        if pairing.done() and future.cancel():
+                            del running[future]
+    finally:
+        if out is not None:
+            out.close()
+    return pairings
+
+
+def report(pairings: list[Pairing]):
+    """The scores (wins, plus half the draws) of the pairings and of each player"""
+    for p in pairings:
+        low, high = wilson_interval(p.score(), p.played)
+        rate = p.score() / p.played if p.played > 0 else 0.0
+        line = (
+            f"{p.a} vs {p.b}: {p.wins}/{p.played} wins, {p.draws} draws, "
+            f"score {rate:.3f} [{low:.3f}, {high:.3f}]"
+        )
+        if p.decision is not None:
+            line += f", SPRT accepts {p.decision}"
+        print(line)
+    scores: dict[str, list[float]] = {}
+    for p in pairings:
+        for spec, points in ((p.a, p.score()), (p.b, p.played - p.score())):
+            score = scores.setdefault(spec, [0, 0])
+            score[0] += points
+            score[1] += p.played
+    print("Overall:")
+    for spec, (points, played) in sorted(
+        scores.items(), key=lambda s: -s[1][0] / max(s[1][1], 1)
+    ):
+        low, high = wilson_interval(points, played)
+        print(f"  {spec}: score {points:g}/{played} [{low:.3f}, {high:.3f}]")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--players", type=str, nargs="+", default=["mcts", "random"], help="player specs"
+    )
+    parser.add_argument(
+        "--mode", type=str, default="gauntlet", choices=["gauntlet", "round_robin"]
+    )
+    parser.add_argument("--games", type=int, default=100, help="games per pairing")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", type=str, default=None, help="JSON lines file")
+    parser.add_argument(
+        "--sprt", type=float, nargs=2, default=None, metavar=("P0", "P1"),
+        help="stop a pairing when the win rate of the first player is settled",
+    )
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--max_plies", type=int, default=500, help="a game is a draw after these moves"
+    )
+    args = parser.parse_args()
+
+    pairs = gauntlet(args.players) if args.mode == "gauntlet" else round_robin(args.players)
+    sprt = None
+    if args.sprt is not None:
+        sprt = Sprt(*args.sprt, args.alpha, args.beta)
+    pairings = run_tournament(
+        pairs,
+        args.games,
+        args.workers,
+        args.output,
+        sprt,
+        args.seed,
+        max_plies=args.max_plies,
+    )
+    report(pairings)
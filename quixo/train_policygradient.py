@@ -5,9 +5,9 @@ from agent import Policy, NeuralPlayer
 from game import Game
 from main import RandomPlayer
 from tqdm import tqdm
-import random
 import os
-from copy import deepcopy
+from selfplay import SelfPlay
+from opponent_pool import OpponentPool
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--policy", type=str, default=None, help="Policy checkpoint to use")
@@ -28,6 +28,45 @@ parser.add_argument(
 parser.add_argument(
     "--episode_count", type=int, default=0, help="Start episode count from..."
 )
+parser.add_argument(
+    "--num_games",
+    type=int,
+    default=1,
+    help="Games played in lockstep, with batched forward passes (see selfplay.py)",
+)
+parser.add_argument(
+    "--batch_episodes",
+    type=int,
+    default=16,
+    help="Episodes per update, with --num_games > 1",
+)
+parser.add_argument(
+    "--sampling",
+    type=str,
+    default="uniform",
+    choices=["uniform", "recent", "winrate"],
+    help="How opponents are sampled from the pool (see opponent_pool.py)",
+)
+parser.add_argument(
+    "--window", type=int, default=10, help="Snapshots sampled with --sampling recent"
+)
+parser.add_argument(
+    "--max_loaded", type=int, default=8, help="Opponents kept loaded in memory"
+)
+parser.add_argument(
+    "--max_snapshots",
+    type=int,
+    default=20,
+    # the pool used to keep every snapshot: 0 gives back that league
+    help="Snapshots kept in the pool, the oldest are dropped (0: no limit, the "
+    "default before the limit of 20)",
+)
+parser.add_argument(
+    "--pool_folder",
+    type=str,
+    default=None,
+    help="Folder where the snapshots are saved, instead of keeping them in memory",
+)
 args = parser.parse_args()
 
 policy = Policy()
@@ -38,48 +77,71 @@ if args.policy is not None:
 player = NeuralPlayer(policy, True)
 random_player = RandomPlayer()
 episode = 0 + args.episode_count
-opponents = [random_player]
+opponents = OpponentPool(
+    [random_player],
+    sampling=args.sampling,
+    window=args.window,
+    max_loaded=args.max_loaded,
+    max_snapshots=args.max_snapshots or None,
+    folder=args.pool_folder,
+)
 
 if args.load_in_folder:
-    print("Loading opponents...")
-    count = 0
-    for file in os.listdir():
-        if file[-4:] == ".mdl":
-            opponent_policy = Policy()
-            opponent_policy.load_state_dict(torch.load(file))
-            opponent = NeuralPlayer(policy=opponent_policy, train=False)
-            opponents.append(opponent)
-            count += 1
-    print(f"Loaded {count} opponents.")
+    # from the oldest, so that the pool keeps the most recent ones
+    files = sorted((f for f in os.listdir() if f[-4:] == ".mdl"), key=os.path.getmtime)
+    for file in files:
+        # loaded when they are first sampled
+        opponents.add_file(file)
+    print(f"Added {len(files)} opponents, {len(opponents.snapshots)} kept.")
 
 rewards = []
 
 pbar = tqdm(total=args.episodes - args.episode_count)
-while episode < args.episodes:
-    game = Game()
-    game.current_player_idx = np.random.randint(0, 2)
-    opponent = random.choice(opponents)
-    reward = game.play(player, opponent)
-    if reward == 0:
-        reward = 1
-    elif reward == -1:
-        reward = 0
-    else:
-        reward = -1
-    player.episode_finished(reward)
+
+
+def episode_done(reward):
+    global episode
     rewards.append(reward)
     episode += 1
     pbar.update(1)
     if episode % args.save_period == 0:
-        new_opponent = deepcopy(player)
-        new_opponent.train = False
-        opponents.append(new_opponent)
+        opponents.add_snapshot(player.policy)
     if episode % args.checkpoint_period == 0:
         torch.save(player.policy.state_dict(), f"policy_training_{episode}.mdl")
     if episode % 100 == 0:
         avg_reward = sum(rewards[-min(len(rewards), 50) :]) / min(len(rewards), 50)
         print(f"Avg reward after {episode} training episodes: {avg_reward:0.5f}")
 
+
+if args.num_games == 1:
+    while episode < args.episodes:
+        game = Game()
+        game.current_player_idx = np.random.randint(0, 2)
+        entry, opponent = opponents.sample()
+        reward = game.play(player, opponent)
+        if reward == 0:
+            reward = 1
+        elif reward == -1:
+            reward = 0
+        else:
+            reward = -1
+        player.episode_finished(reward)
+        opponents.record(entry, reward)
+        episode_done(reward)
+else:
+    env = SelfPlay(player, opponents, args.num_games)
+    batch = []
+    while episode < args.episodes:
+        for episode_ in env.step():
+            if episode >= args.episodes:
+                break
+            batch.append(episode_)
+            if len(batch) == args.batch_episodes:
+                player.episodes_finished(batch)
+                batch = []
+            episode_done(episode_[2])
+    player.episodes_finished(batch)
+
 pbar.close()
 
 torch.save(player.policy.state_dict(), f"policy_training_{episode}.mdl")
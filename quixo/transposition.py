@@ -0,0 +1,177 @@
+from collections import OrderedDict
+from mcts_node import MctsNode
+from bitboard import BitBoard
+from symmetry import canonicalize
+from zobrist import zobrist_hash
+
+
+class TranspositionTable:
+    """Node table for MctsPlayer with an optional cap on the number of entries.
+    When the cap is exceeded, about a tenth of the entries are evicted, either the
+    least recently used (eviction="lru") or the least visited (eviction="visits").
+    An evicted node that has been visited forgets its children (it keeps its
+    statistics, and it will be expanded again when it is visited); a node leaves the
+    table only when no visited node has it among its children, so that the nodes of
+    the tree are all in the table and the memory is bounded by the cap. The root, the
+    paths of the current simulation and the nodes it looked up or created are never
+    evicted, and the children of the root are never removed (they can forget their
+    own children), so the cap can be exceeded by about two expansions.
+    With symmetry=True, boards are stored in their canonical orientation, so that
+    the 8 rotations and reflections of a board share the same node.
+    With zobrist=True, the keys are the 64-bit Zobrist hashes of the boards instead
+    of their exact encodings: a node found under a key is checked against the exact
+    board, and a collision counts as a miss (the entry is then replaced)."""
+
+    def __init__(
+        self,
+        max_entries: int = None,
+        eviction: str = "lru",
+        symmetry: bool = False,
+        zobrist: bool = False,
+    ):
+        assert eviction in {"lru", "visits"}
+        self.max_entries = max_entries
+        self.eviction = eviction
+        self.symmetry = symmetry
+        self.zobrist = zobrist
+        self.entries: OrderedDict = OrderedDict()
+        # keys that must not be evicted
+        self.root_keys: set = set()
+        self.path_keys: set = set()
+        self.root: MctsNode = None
+        # keys looked up or added by the current simulation (None outside of one)
+        self.simulation_keys: set = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.collisions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __getitem__(self, key) -> MctsNode:
+        return self.entries[key]
+
+    def __setitem__(self, key, node: MctsNode):
+        self.entries[key] = node
+        self.entries.move_to_end(key)
+        if self.simulation_keys is not None:
+            self.simulation_keys.add(key)
+        if self.max_entries is not None and len(self.entries) > self.max_entries:
+            self.evict(len(self.entries) - self.max_entries * 9 // 10)
+
+    def keys(self):
+        return self.entries.keys()
+
+    def encode(self, board) -> int:
+        """The board (NumPy or BitBoard) as it is encoded in the keys of the table"""
+        if not isinstance(board, BitBoard):
+            board = BitBoard.from_array(board)
+        if self.symmetry:
+            return canonicalize(board)[0]
+        return board.encode()
+
+    def key(self, board_: int, turn: int, board_hash: int = None):
+        """Key of the encoded board_ (see encode). board_hash is the Zobrist hash of
+        the board, if known; it is not used with symmetry, since the hash must be the
+        one of the canonical board."""
+        if not self.zobrist:
+            return (board_, turn)
+        if board_hash is None or self.symmetry:
+            board_hash = zobrist_hash(BitBoard.decode(board_))
+        return (board_hash, turn)
+
+    def get(self, key, default=None, board_: int = None):
+        """If the encoded board_ is given, the node is checked against it"""
+        node = self.entries.get(key)
+        if node is not None and board_ is not None and node.board != board_:
+            self.collisions += 1
+            node = None
+        if node is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        if self.simulation_keys is not None:
+            self.simulation_keys.add(key)
+        if self.eviction == "lru":
+            self.entries.move_to_end(key)
+        return node
+
+    def clear(self):
+        self.entries.clear()
+        self.root_keys = set()
+        self.path_keys = set()
+        self.root = None
+        self.simulation_keys = None
+
+    def set_root(self, root: MctsNode):
+        """Protects the root and its children from eviction"""
+        old_root = self.root
+        if old_root is not None and old_root is not root:
+            old_key = self.key(old_root.board, old_root.get_turn())
+            if self.entries.get(old_key) is not old_root:
+                # a root that is not in the table no longer refers to its children
+                old_root.forget_children()
+        self.root = root
+        nodes = [root] + root.get_children()
+        self.root_keys = {self.key(node.board, node.get_turn()) for node in nodes}
+        self.simulation_keys = None
+
+    def start_simulation(self):
+        """Protects the nodes of the simulation (or batch of simulations) that
+        starts, see set_path, until the next one"""
+        self.path_keys = set()
+        self.simulation_keys = set()
+
+    def set_path(self, path: list[MctsNode]):
+        """Protects the nodes traversed by the current simulation from eviction"""
+        self.path_keys |= {self.key(node.board, node.get_turn()) for node in path}
+
+    def evict(self, n: int):
+        """Frees about n entries, in the order of the eviction policy: a visited node
+        forgets its children, which are removed with it if no other node refers to
+        them"""
+        # the nodes of the simulation must keep their children, the children of the
+        # root must stay in the table
+        active = self.path_keys | (self.simulation_keys or set())
+        protected = active | self.root_keys
+        candidates = [k for k in self.entries.keys() if k not in active]
+        if self.eviction == "visits":
+            candidates.sort(key=lambda k: self.entries[k].get_simulations())
+        freed = 0
+        for key in candidates:
+            if freed >= n:
+                break
+            node = self.entries.get(key)
+            if node is None or node is self.root:
+                # the node was removed with its parent, or it is the root
+                continue
+            if node.get_visited():
+                children = node.get_children()
+                node.forget_children()
+                for child in children:
+                    freed += self._remove(child, protected)
+            freed += self._remove(node, protected)
+        self.evictions += freed
+
+    def _remove(self, node: MctsNode, protected: set) -> int:
+        """Removes the node if no visited node refers to it; returns 1 if it did"""
+        if node.parents > 0 or node.get_visited():
+            return 0
+        key = self.key(node.board, node.get_turn())
+        if key in protected or self.entries.get(key) is not node:
+            return 0
+        del self.entries[key]
+        return 1
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "collisions": self.collisions,
+        }
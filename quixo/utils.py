@@ -1,7 +1,10 @@
-from copy import deepcopy
+from itertools import compress
 from game import Move
 import numpy as np
 from mcts_node import MctsNode
+from transposition import TranspositionTable
+from bitboard import BitBoard, SLIDES, SLIDE_GATHERS, encode
+from zobrist import SEGMENTS, update_hash, update_hash_cells
 
 
 def get_cell_sides(cell):
@@ -19,27 +22,31 @@ def get_cell_sides(cell):
 
 def get_new_board(board, my_id, action):
     """Assumes the action is valid"""
-    board = deepcopy(board)
-    if action[1] == Move.TOP:
-        for i in range(action[0][1], 0, -1):
-            board[i, action[0][0]] = board[i - 1, action[0][0]]
-        board[0, action[0][0]] = my_id
-    if action[1] == Move.LEFT:
-        for i in range(action[0][0], 0, -1):
-            board[action[0][1], i] = board[action[0][1], i - 1]
-        board[action[0][1], 0] = my_id
-    if action[1] == Move.RIGHT:
-        for i in range(action[0][0], 4, 1):
-            board[action[0][1], i] = board[action[0][1], i + 1]
-        board[action[0][1], 4] = my_id
-    if action[1] == Move.BOTTOM:
-        for i in range(action[0][1], 4, 1):
-            board[i, action[0][0]] = board[i + 1, action[0][0]]
-        board[4, action[0][0]] = my_id
+    if isinstance(board, BitBoard):
+        return board.move(my_id, action)
+    a = ACTION_INDEX[action]
+    board = board.ravel()[ACTION_PERMUTATIONS[a]].reshape(5, 5)
+    board.flat[ACTION_DESTINATIONS[a]] = my_id
     return board
 
 
+def get_new_board_and_hash(board, board_hash, my_id, action):
+    """Like get_new_board, also updates the Zobrist hash of the board in
+    O(slide length). Assumes the action is valid"""
+    new_board = get_new_board(board, my_id, action)
+    if isinstance(board, BitBoard):
+        return new_board, update_hash(board_hash, board, new_board)
+    (x, y), move = action
+    cells = SEGMENTS[(x, y, move.value)]
+    board_hash = update_hash_cells(
+        board_hash, cells, board.ravel()[cells], new_board.ravel()[cells]
+    )
+    return new_board, board_hash
+
+
 def how_many_in_line(board, player):
+    if isinstance(board, BitBoard):
+        return board.longest_line(player)
     board = board == player
     t = 0
     for i in range(5):
@@ -58,21 +65,6 @@ def how_many_in_line(board, player):
     return t
 
 
-def get_possible_actions(
-    board: np.ndarray, my_id: int
-) -> tuple[list[np.ndarray], list[tuple]]:
-    actions = []
-    boards = []
-    for i in range(5):
-        for j in range(5):
-            if i in {0, 4} or j in {0, 4}:
-                if board[j, i] in {-1, my_id}:
-                    for k in {0, 1, 2, 3} - get_cell_sides((i, j)):
-                        actions.append(((i, j), Move(k)))
-                        boards.append(get_new_board(board, my_id, ((i, j), Move(k))))
-    return boards, actions
-
-
 def map_board(x: int):
     if x // 4 == 0:
         pos = (x % 4, 0)
@@ -105,8 +97,123 @@ def inverse_map_move(t: Move):
         s = 3
     return s
 
+
+def _actions_table():
+    actions = []
+    for i in range(5):
+        for j in range(5):
+            if i in {0, 4} or j in {0, 4}:
+                for k in {0, 1, 2, 3} - get_cell_sides((i, j)):
+                    actions.append(((i, j), Move(k)))
+    return actions
+
+
+def _permutation(action):
+    """Flat indices such that board.ravel()[permutation] is the board after the
+    action, except for the destination of the taken piece."""
+    board = np.arange(25).reshape(5, 5)
+    (x, y), move = action
+    if move == Move.TOP:
+        board[1 : y + 1, x] = board[0:y, x].copy()
+    elif move == Move.BOTTOM:
+        board[y:4, x] = board[y + 1 : 5, x].copy()
+    elif move == Move.LEFT:
+        board[y, 1 : x + 1] = board[y, 0:x].copy()
+    elif move == Move.RIGHT:
+        board[y, x:4] = board[y, x + 1 : 5].copy()
+    return board.ravel()
+
+
+def _destination(action):
+    (x, y), move = action
+    if move == Move.TOP:
+        return x
+    if move == Move.BOTTOM:
+        return 20 + x
+    if move == Move.LEFT:
+        return y * 5
+    return y * 5 + 4
+
+
+# All the 44 border actions (cell, slide), in the order in which they are enumerated
+ACTIONS: list[tuple[tuple[int, int], Move]] = _actions_table()
+ACTION_INDEX = {action: a for a, action in enumerate(ACTIONS)}
+# flat index of the taken piece, row and column for NumPy boards, bit for bitboards
+ACTION_CELLS = np.array([y * 5 + x for (x, y), _ in ACTIONS])
+ACTION_BITS = [1 << int(c) for c in ACTION_CELLS]
+# how the board is rearranged by each action, and where the taken piece lands
+ACTION_PERMUTATIONS = np.stack([_permutation(action) for action in ACTIONS])
+ACTION_DESTINATIONS = np.array([_destination(action) for action in ACTIONS])
+# (side, cell) index of each action in the output of agent.Policy
+ACTION_SIDES = np.array([move.value for _, move in ACTIONS])
+ACTION_POLICY_CELLS = np.array([inverse_map_board(cell) for cell, _ in ACTIONS])
+# index in ACTIONS of each flattened (side, cell) output of agent.Policy, -1 if
+# the side is not allowed for the cell
+POLICY_ACTIONS = np.full(4 * 16, -1)
+POLICY_ACTIONS[ACTION_SIDES * 16 + ACTION_POLICY_CELLS] = np.arange(len(ACTIONS))
+# for bitboards: (bit of the taken piece, keep, shifted, up, down, dest),
+# see bitboard.SLIDES
+ACTION_SLIDES = [
+    (ACTION_BITS[a], *SLIDES[(x, y, move.value)])
+    for a, ((x, y), move) in enumerate(ACTIONS)
+]
+# for bitboards: the row or column changed by each action, to update the line
+# counts (see bitboard.update_counts)
+ACTION_GATHERS = [SLIDE_GATHERS[(x, y, move.value)] for (x, y), move in ACTIONS]
+
+
+def get_legal_mask(board, my_id) -> np.ndarray:
+    """Boolean mask over ACTIONS: an action is legal if the taken piece is
+    neutral or belongs to my_id"""
+    if isinstance(board, BitBoard):
+        other = board.bits[1 - my_id]
+        return np.array([not other & bit for bit in ACTION_BITS])
+    owners = board.ravel()[ACTION_CELLS]
+    return (owners == -1) | (owners == my_id)
+
+
+def get_legal_masks(boards: np.ndarray, my_ids) -> np.ndarray:
+    """get_legal_mask for a batch of NumPy boards (N, 5, 5) or (N, 25) and the
+    player of each board: returns an (N, len(ACTIONS)) mask"""
+    owners = boards.reshape(len(boards), 25)[:, ACTION_CELLS]
+    my_ids = np.broadcast_to(my_ids, (len(boards),))[:, None]
+    return (owners == -1) | (owners == my_ids)
+
+
+def get_new_boards(boards: np.ndarray, my_ids, actions) -> np.ndarray:
+    """get_new_board for a batch of NumPy boards (N, 25), with the indices of the
+    actions in ACTIONS. Assumes the actions are valid"""
+    rows = np.arange(len(boards))
+    new_boards = np.take_along_axis(boards, ACTION_PERMUTATIONS[actions], axis=1)
+    new_boards[rows, ACTION_DESTINATIONS[actions]] = my_ids
+    return new_boards
+
+
+def get_legal_actions(board, my_id) -> list[tuple]:
+    """Like get_possible_actions, but only returns the actions without building
+    the resulting boards"""
+    if isinstance(board, BitBoard):
+        other = board.bits[1 - my_id]
+        return [ACTIONS[a] for a in range(len(ACTIONS)) if not other & ACTION_BITS[a]]
+    return list(compress(ACTIONS, get_legal_mask(board, my_id)))
+
+
+def get_possible_actions(
+    board: np.ndarray, my_id: int
+) -> tuple[list[np.ndarray], list[tuple]]:
+    if isinstance(board, BitBoard):
+        actions = get_legal_actions(board, my_id)
+        return [board.move(my_id, action) for action in actions], actions
+    legal = np.flatnonzero(get_legal_mask(board, my_id))
+    boards = board.ravel()[ACTION_PERMUTATIONS[legal]]
+    boards[np.arange(len(legal)), ACTION_DESTINATIONS[legal]] = my_id
+    return list(boards.reshape(-1, 5, 5)), [ACTIONS[a] for a in legal]
+
+
 def check_win(board, turn):
     """0: win 0, 1: win 1"""
+    if isinstance(board, BitBoard):
+        return board.check_win()
     winner = -1
     for i in range(5):
         if board[i, 0] != -1 and all(board[i, :] == board[i, 0]):
@@ -131,16 +238,22 @@ def minimax_heuristic(board, turn):
     return (how_many_in_line(board, 0) - how_many_in_line(board, 1)) / 5
 
 
-def lookup_node(board: np.ndarray, turn: int, node_table: dict, create=True):
+def lookup_node(
+    board: np.ndarray, turn: int, node_table: dict, create=True, board_hash=None
+):
     """Looks up a node in the node_table, if it doesn't exists and create is True,
-    it creates it."""
-    board_ = tuple(board.ravel())
-    if (board_, turn) not in node_table.keys():
-        if create:
-            node = MctsNode(board, turn)
-            node_table[(board_, turn)] = node
-        else:
-            node = None
+    it creates it. The board of the node is in the orientation used by node_table,
+    see TranspositionTable.encode. board_hash is the Zobrist hash of the board,
+    if it is known, for tables that key on it."""
+    if isinstance(node_table, TranspositionTable):
+        board_ = node_table.encode(board)
+        key = node_table.key(board_, turn, board_hash)
+        node = node_table.get(key, board_=board_)
     else:
-        node = node_table[(board_, turn)]
+        board_ = encode(board)
+        key = (board_, turn)
+        node = node_table.get(key)
+    if node is None and create:
+        node = MctsNode(BitBoard.decode(board_), turn)
+        node_table[key] = node
     return node
@@ -0,0 +1,74 @@
+import numpy as np
+from bitboard import BitBoard, SLIDES, FULL
+
+# Zobrist hashing: each (player, cell) has a random 64-bit number, and the hash
+# of a board is the XOR of the numbers of the occupied cells. The hash is linear
+# in the XOR sense, so after a move it can be updated from the cells that changed.
+_rng = np.random.default_rng(5)
+ZOBRIST = [
+    [int(z) for z in _rng.integers(0, 2**63, size=25, dtype=np.int64)] for _ in range(2)
+]
+
+
+def _row_tables(numbers: list[int]) -> list[list[int]]:
+    """tables[r][v] is the XOR of the numbers of the bits v in the row r"""
+    tables = []
+    for r in range(5):
+        table = []
+        for v in range(32):
+            h = 0
+            for x in range(5):
+                if v >> x & 1:
+                    h ^= numbers[r * 5 + x]
+            table.append(h)
+        tables.append(table)
+    return tables
+
+
+# XORed to the hash when it is player 1's turn, for searches that hash the turn too
+ZOBRIST_TURN = int(_rng.integers(0, 2**63, dtype=np.int64))
+
+_ROW_TABLES = [_row_tables(numbers) for numbers in ZOBRIST]
+# flat indices of the cells changed by each move, see bitboard.SLIDES
+SEGMENTS = {
+    move: [i for i in range(25) if (FULL & ~masks[0]) >> i & 1]
+    for move, masks in SLIDES.items()
+}
+
+
+def hash_bits(bits: int, player: int) -> int:
+    tables = _ROW_TABLES[player]
+    return (
+        tables[0][bits & 31]
+        ^ tables[1][bits >> 5 & 31]
+        ^ tables[2][bits >> 10 & 31]
+        ^ tables[3][bits >> 15 & 31]
+        ^ tables[4][bits >> 20 & 31]
+    )
+
+
+def zobrist_hash(board) -> int:
+    """Hash of a NumPy board or a BitBoard"""
+    if not isinstance(board, BitBoard):
+        board = BitBoard.from_array(board)
+    return hash_bits(board.bits[0], 0) ^ hash_bits(board.bits[1], 1)
+
+
+def update_hash(board_hash: int, old: BitBoard, new: BitBoard) -> int:
+    """Hash of new, given the hash of old"""
+    return (
+        board_hash
+        ^ hash_bits(old.bits[0] ^ new.bits[0], 0)
+        ^ hash_bits(old.bits[1] ^ new.bits[1], 1)
+    )
+
+
+def update_hash_cells(board_hash: int, cells, old_values, new_values) -> int:
+    """Hash of a NumPy board whose cells (flat indices) went from old_values to new_values"""
+    for i, old, new in zip(cells, old_values, new_values):
+        if old != new:
+            if old != -1:
+                board_hash ^= ZOBRIST[old][i]
+            if new != -1:
+                board_hash ^= ZOBRIST[new][i]
+    return board_hash